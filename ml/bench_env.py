@@ -0,0 +1,58 @@
+import time
+import tracemalloc
+import numpy as np
+from reco_env import SequentialRecEnv
+
+# -----------------------------
+# Simulator throughput benchmark
+# Steps/sec and memory of the default (eager) env vs scaled mode.
+# -----------------------------
+EMBED_DIM = 8
+SEQ_LEN = 5
+MAX_STEPS = 20
+EPISODES = 500
+
+# (num_groups, num_users); eager mode is skipped where it would materialize too much
+SCALES = [(50, 200), (1_000, 100_000), (10_000, 1_000_000), (10_000, 10_000_000)]
+EAGER_MAX_USERS = 1_000_000
+
+
+def run(num_groups, num_users, scaled):
+    tracemalloc.start()
+    env = SequentialRecEnv(
+        num_groups=num_groups,
+        num_users=num_users,
+        embed_dim=EMBED_DIM,
+        seq_len=SEQ_LEN,
+        max_steps=MAX_STEPS,
+        seed=0,
+        scaled=scaled,
+    )
+    _, build_peak = tracemalloc.get_traced_memory()
+    actions = np.random.default_rng(1).integers(0, num_groups, size=MAX_STEPS * EPISODES).tolist()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+
+    steps = 0
+    start = time.perf_counter()
+    for _ in range(EPISODES):
+        env.reset()
+        done = False
+        while not done:
+            _, _, done, _, _ = env.step(actions[steps])
+            steps += 1
+    elapsed = time.perf_counter() - start
+    _, step_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return steps / elapsed, build_peak, step_peak - baseline
+
+
+print(f"D={EMBED_DIM}, {EPISODES} episodes x {MAX_STEPS} steps, random actions")
+print(f"{'groups':>7} {'users':>10} {'mode':>7} {'steps/s':>10} {'env MB':>8} {'step-loop KB':>13}")
+for num_groups, num_users in SCALES:
+    for scaled in (False, True):
+        if not scaled and num_users > EAGER_MAX_USERS:
+            continue
+        rate, build_peak, step_peak = run(num_groups, num_users, scaled)
+        print(f"{num_groups:>7} {num_users:>10} {'scaled' if scaled else 'eager':>7} {rate:>10,.0f} "
+              f"{build_peak / 2**20:>8.1f} {step_peak / 2**10:>13.1f}")
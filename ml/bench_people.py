@@ -0,0 +1,46 @@
+import time
+import tracemalloc
+import numpy as np
+from columnar import JobData
+from people_matching import PeopleMatcher
+
+# -----------------------------
+# People matching benchmark
+# Per-query-user cost and peak memory of the blocked user-to-user top-k
+# as the candidate pool grows; memory should stay flat.
+# -----------------------------
+K = 8
+QUERIES = 2048
+GROUPS_PER_USER = 4
+INTERESTS = ["music", "art", "ai", "hiking", "chess", "food", "film", "yoga", "running", "books"]
+SCALES = [10_000, 50_000, 200_000]
+
+
+def synthetic_job(num_users, rng):
+    num_groups = max(num_users // 10, 10)
+    users = [{"id": f"u{i}"} for i in range(num_users)]
+    groups = [{"id": g} for g in range(num_groups)]
+    memberships = [
+        {"user_id": f"u{i}", "group_id": int(g)}
+        for i in range(num_users)
+        for g in rng.choice(num_groups, rng.integers(0, GROUPS_PER_USER + 1), replace=False)
+    ]
+    interests = {f"u{i}": list(rng.choice(INTERESTS, rng.integers(0, 4), replace=False)) for i in range(num_users)}
+    return JobData.from_rows(users, groups, memberships, interests)
+
+
+rng = np.random.default_rng(0)
+print(f"k={K}, {QUERIES} query users per scale")
+print(f"{'users':>8} {'ms/user':>8} {'est. full run':>14} {'peak MB':>8}")
+
+for num_users in SCALES:
+    data = synthetic_job(num_users, rng)
+    matcher = PeopleMatcher()
+    tracemalloc.start()
+    start = time.perf_counter()
+    matcher.recommend(data, top_k=K, user_codes=data.user_codes[:QUERIES])
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    per_user = elapsed / QUERIES
+    print(f"{num_users:>8} {per_user * 1e3:>8.2f} {per_user * num_users / 60:>12.1f}m {peak / 1e6:>8.0f}")
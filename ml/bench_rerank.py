@@ -0,0 +1,51 @@
+import time
+import numpy as np
+from rerank import mmr_rerank, unit_embeddings
+from topk import topk_with_exclusions
+
+# -----------------------------
+# MMR re-ranking benchmark
+# Per-user cost of the re-ranking stage and the diversity it buys
+# (mean pairwise cosine similarity within each user's top-k).
+# -----------------------------
+BATCH = 512
+K = 8
+CANDIDATES = 32
+EMBED_DIM = 8
+REPEATS = 3
+
+
+def intra_list_similarity(indices, units):
+    picked = units[indices]  # (B, k, D)
+    sims = np.einsum("bid,bjd->bij", picked, picked)
+    k = indices.shape[1]
+    return (sims.sum(axis=(1, 2)) - k) / (k * (k - 1))
+
+
+def best_of(fn):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+rng = np.random.default_rng(0)
+print(f"B={BATCH} users, {CANDIDATES} candidates -> top {K}, D={EMBED_DIM}, best of {REPEATS}")
+print(f"{'groups':>7} {'lambda':>7} {'us/user':>8} {'ILS top-k':>10} {'ILS MMR':>8} {'rel. kept':>10}")
+
+for num_groups in (50, 1_000, 10_000):
+    units = unit_embeddings(rng.normal(size=(num_groups, EMBED_DIM)).astype(np.float32))
+    # Q-values correlated with embeddings, as neighbouring actions score alike
+    users = rng.normal(size=(BATCH, EMBED_DIM)).astype(np.float32)
+    scores = users @ units.T + 0.1 * rng.normal(size=(BATCH, num_groups)).astype(np.float32)
+    cand, cand_scores, counts = topk_with_exclusions(scores, CANDIDATES)
+    baseline_ils = intra_list_similarity(cand[:, :K], units).mean()
+    baseline_rel = cand_scores[:, :K].sum()
+
+    for lam in (0.9, 0.7, 0.5):
+        elapsed, (idx, sel_scores, _) = best_of(lambda: mmr_rerank(cand, cand_scores, counts, units, K, lam=lam))
+        ils = intra_list_similarity(idx, units).mean()
+        print(f"{num_groups:>7} {lam:>7.1f} {elapsed / BATCH * 1e6:>8.1f} {baseline_ils:>10.3f} {ils:>8.3f} "
+              f"{sel_scores.sum() / baseline_rel:>9.1%}")
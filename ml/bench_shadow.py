@@ -0,0 +1,79 @@
+import copy
+import os
+import tempfile
+import time
+import numpy as np
+import torch
+from torch.func import functional_call, stack_module_state
+from columnar import JobData
+from recommender import RecommendationEngine
+
+# -----------------------------
+# Shadow scoring benchmark
+# Group scoring time with 0..MAX_SHADOWS shadow models next to the primary;
+# state building is shared, so each shadow should add far less than 1x.
+# Also compares per-model forwards over the shared state tensor with one
+# stacked (vmap) forward of all models.
+# -----------------------------
+NUM_USERS = 20_000
+NUM_GROUPS = 200
+GROUPS_PER_USER = 4
+MAX_SHADOWS = 3
+MODEL_PATH = "dqn_recommender.pth"
+FORWARD_BATCH = 512
+FORWARD_REPEATS = 200
+INTERESTS = ["music", "art", "ai", "hiking", "chess", "food", "film", "yoga", "running", "books"]
+
+
+def synthetic_job(interner, rng):
+    users = [{"id": f"u{i}"} for i in range(NUM_USERS)]
+    groups = [{"id": g} for g in range(1, NUM_GROUPS + 1)]
+    memberships = [
+        {"user_id": f"u{i}", "group_id": int(g)}
+        for i in range(NUM_USERS)
+        for g in rng.choice(np.arange(1, NUM_GROUPS + 1), rng.integers(0, GROUPS_PER_USER + 1), replace=False)
+    ]
+    interests = {f"u{i}": list(rng.choice(INTERESTS, rng.integers(0, 4), replace=False)) for i in range(NUM_USERS)}
+    return JobData.from_rows(users, groups, memberships, interests, interner=interner)
+
+
+rng = np.random.default_rng(0)
+weights = torch.load(MODEL_PATH, map_location="cpu")
+with tempfile.TemporaryDirectory() as tmp:
+    shadow_path = os.path.join(tmp, "shadow.pth")
+    torch.save({k: v + 0.05 * torch.randn_like(v) for k, v in weights.items()}, shadow_path)
+
+    print(f"{NUM_USERS} users, {NUM_GROUPS} groups")
+    print(f"{'shadows':>8} {'seconds':>8} {'vs primary only':>16} {'shared s':>9} {'forward s':>10} {'rank s/variant':>15}")
+    baseline = None
+    for shadows in range(MAX_SHADOWS + 1):
+        spec = ",".join(f"s{i}={shadow_path}:0.1" for i in range(shadows))
+        engine = RecommendationEngine(model_path=MODEL_PATH, shadow_models=spec)
+        data = synthetic_job(engine.users, rng)
+        engine.generate_recommendations(data, top_k=8)  # first run also syncs co-membership
+        start = time.perf_counter()
+        batch = engine.generate_recommendations(data, top_k=8)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        line = f"{shadows:>8} {elapsed:>8.2f} {elapsed / baseline:>15.2f}x"
+        experiment = batch.meta.get("experiment")
+        if experiment is not None:
+            rank = np.mean([v["rank_seconds"] for v in experiment["by_variant"].values()])
+            line += f" {experiment['shared_seconds']:>9.2f} {experiment['forward_seconds']:>10.3f} {rank:>15.3f}"
+        print(line)
+
+    # Forward pass alone: per-model calls vs one stacked vmap call
+    models = engine.models
+    params, buffers = stack_module_state(models)
+    template = copy.deepcopy(models[0]).to("meta")
+    stacked = torch.vmap(lambda p, b, x: functional_call(template, (p, b), (x,)), in_dims=(0, 0, None))
+    states = torch.randn(FORWARD_BATCH, engine.env.embed_dim * 2)
+    with torch.no_grad():
+        assert torch.equal(stacked(params, buffers, states), torch.stack([m(states) for m in models]))
+        print(f"\nForward of {len(models)} models on {FORWARD_BATCH} states (identical outputs):")
+        for name, fn in (("per-model", lambda: [m(states) for m in models]),
+                         ("stacked vmap", lambda: stacked(params, buffers, states))):
+            start = time.perf_counter()
+            for _ in range(FORWARD_REPEATS):
+                fn()
+            print(f"  {name:>12}: {(time.perf_counter() - start) / FORWARD_REPEATS * 1e6:>8.0f} us")
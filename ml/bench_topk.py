@@ -0,0 +1,70 @@
+import time
+import numpy as np
+import torch
+from topk import csr_from_lists, topk_with_exclusions
+
+# -----------------------------
+# Top-k micro-benchmark
+# Compares the old per-user paths (full argsort / torch.topk with Python
+# masking loops) against the batched partial-selection kernel. Speedup is
+# against the faster of the two old paths; below 1x the kernel is slower.
+# -----------------------------
+BATCH = 512
+K = 8
+MEMBERSHIPS_PER_USER = 5
+REPEATS = 3
+
+
+def per_user_argsort(scores, exclusions, k):
+    out = []
+    for row, groups in zip(scores, exclusions):
+        q = row.copy()
+        for g in groups:
+            q[g] = -1e9
+        out.append(np.argsort(q)[::-1][:k])
+    return out
+
+
+def per_user_torch_topk(scores, exclusions, k):
+    out = []
+    for row, groups in zip(torch.from_numpy(scores), exclusions):
+        q = row.clone()
+        for g in groups:
+            q[g] = -1e9
+        out.append(torch.topk(q, k).indices)
+    return out
+
+
+def batched_kernel(scores, exclusions, k, indptr, indices, out_indices, out_scores):
+    # The job masks its per-chunk score buffer in place, so benchmark that path
+    return topk_with_exclusions(scores, k, indptr, indices, out_indices=out_indices, out_scores=out_scores,
+                                inplace=True)
+
+
+def best_of(fn, *args):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+rng = np.random.default_rng(0)
+print(f"B={BATCH} users, k={K}, {MEMBERSHIPS_PER_USER} exclusions/user, best of {REPEATS}")
+print(f"{'groups':>8} {'argsort/user':>14} {'torch.topk/user':>16} {'batched kernel':>15} {'vs best old':>12}")
+
+for num_groups in (1_000, 10_000, 100_000):
+    scores = rng.normal(size=(BATCH, num_groups)).astype(np.float32)
+    exclusions = [rng.choice(num_groups, MEMBERSHIPS_PER_USER, replace=False).tolist() for _ in range(BATCH)]
+    indptr, indices = csr_from_lists(exclusions)
+    out_indices = np.empty((BATCH, K), dtype=np.int64)
+    out_scores = np.empty((BATCH, K), dtype=np.float32)
+
+    t_sort = best_of(per_user_argsort, scores, exclusions, K)
+    t_torch = best_of(per_user_torch_topk, scores, exclusions, K)
+    t_kernel = best_of(batched_kernel, scores, exclusions, K, indptr, indices, out_indices, out_scores)
+
+    speedup = min(t_sort, t_torch) / t_kernel
+    print(f"{num_groups:>8} {t_sort * 1e3:>12.1f}ms {t_torch * 1e3:>14.1f}ms {t_kernel * 1e3:>13.1f}ms "
+          f"{speedup:>11.2f}x{'' if speedup > 1 else '  (no gain)'}")
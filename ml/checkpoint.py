@@ -0,0 +1,156 @@
+"""
+Training checkpoints for train_dqn.py.
+
+A checkpoint holds everything needed to continue a run bit-for-bit:
+- q_net, target_net and optimizer state, epsilon and step count
+- Python `random`, NumPy global, torch (and CUDA) RNG states
+- the env's Generator state and latent embeddings
+- the replay buffer, as a compressed .npz snapshot
+- loop progress (next episode, reward history)
+
+Snapshotting (copying tensors/arrays) happens on the training thread at an
+episode boundary; serialization, compression and the atomic rename happen
+on a background thread so training does not stall on disk I/O.
+
+Layout:
+    <directory>/ckpt_<episode>/state.pt
+    <directory>/ckpt_<episode>/replay.npz
+    <directory>/latest            (name of the newest complete checkpoint)
+"""
+import os
+import random
+import shutil
+import threading
+from datetime import datetime
+
+import numpy as np
+import torch
+
+
+def capture_rng_states():
+    return {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+    }
+
+
+def restore_rng_states(states):
+    random.setstate(states["python"])
+    np.random.set_state(states["numpy"])
+    torch.set_rng_state(states["torch"])
+    if states["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(states["cuda"])
+
+
+def capture_env_state(env):
+    state = {
+        "rng": env.rng.bit_generator.state,
+        "group_embeddings": env.group_embeddings.copy(),
+        "scaled": env.scaled,
+    }
+    if env.scaled:
+        state["user_seed"] = env.user_seed
+    else:
+        state["user_embeddings"] = env.user_embeddings.copy()
+    return state
+
+
+def restore_env_state(env, state):
+    if state["scaled"] != env.scaled:
+        raise ValueError("Checkpoint was written with a different env mode (scaled vs eager)")
+    env.rng.bit_generator.state = state["rng"]
+    env.group_embeddings[:] = state["group_embeddings"]
+    if env.scaled:
+        env.user_seed = state["user_seed"]
+        norms = np.linalg.norm(env.group_embeddings, axis=1, keepdims=True)
+        env.unit_group_embeddings[:] = env.group_embeddings / (norms + 1e-8)
+    else:
+        env.user_embeddings[:] = state["user_embeddings"]
+
+
+class Checkpointer:
+    """Periodic asynchronous checkpoints of a DQN training run."""
+
+    def __init__(self, directory, every_episodes=25, keep_last=3):
+        self.directory = directory
+        self.every_episodes = every_episodes
+        self.keep_last = keep_last
+        self._writer = None
+        self.last_error = None
+        os.makedirs(directory, exist_ok=True)
+
+    def due(self, episodes_done):
+        return self.every_episodes > 0 and episodes_done % self.every_episodes == 0
+
+    def save_async(self, agent, env, next_episode, reward_history):
+        """Snapshot now, write in the background. Waits for the previous write first,
+        so at most one snapshot is held in memory besides the live state."""
+        self.wait()
+        state = {
+            "agent": agent.state_dict(),
+            "rng": capture_rng_states(),
+            "env": capture_env_state(env),
+            "next_episode": next_episode,
+            "reward_history": list(reward_history),
+            "saved_at": datetime.now().isoformat(),
+        }
+        replay = agent.buffer.snapshot()
+        name = f"ckpt_{next_episode:06d}"
+        self._writer = threading.Thread(target=self._write, args=(name, state, replay), daemon=True)
+        self._writer.start()
+
+    def wait(self):
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self.last_error is not None:
+            error, self.last_error = self.last_error, None
+            raise RuntimeError(f"Checkpoint write failed: {error}")
+
+    def _write(self, name, state, replay):
+        final = os.path.join(self.directory, name)
+        tmp = final + ".tmp"
+        try:
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            torch.save(state, os.path.join(tmp, "state.pt"))
+            np.savez_compressed(os.path.join(tmp, "replay.npz"), **replay)
+            shutil.rmtree(final, ignore_errors=True)
+            os.replace(tmp, final)
+            latest_tmp = os.path.join(self.directory, "latest.tmp")
+            with open(latest_tmp, "w") as f:
+                f.write(name)
+            os.replace(latest_tmp, os.path.join(self.directory, "latest"))
+            self._prune()
+            print(f"[{datetime.now().isoformat()}] Checkpoint written: {final}")
+        except Exception as e:
+            self.last_error = e
+
+    def _prune(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("ckpt_") and not n.endswith(".tmp"))
+        for name in names[:-self.keep_last] if self.keep_last > 0 else []:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+def resolve_checkpoint(path):
+    """Accept a checkpoint dir, or a checkpoints root (uses its `latest` pointer)."""
+    pointer = os.path.join(path, "latest")
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            return os.path.join(path, f.read().strip())
+    return path
+
+
+def load_checkpoint(path, agent, env):
+    """Restore agent, replay buffer, env and RNG states; returns (next_episode, reward_history)."""
+    path = resolve_checkpoint(path)
+    state = torch.load(os.path.join(path, "state.pt"), map_location=agent.device, weights_only=False)
+    with np.load(os.path.join(path, "replay.npz")) as replay:
+        agent.buffer.restore({k: replay[k] for k in replay.files}, device=agent.device)
+    agent.load_state_dict(state["agent"])
+    restore_env_state(env, state["env"])
+    restore_rng_states(state["rng"])
+    print(f"[{datetime.now().isoformat()}] Resumed from {path} (episode {state['next_episode']})")
+    return state["next_episode"], state["reward_history"]
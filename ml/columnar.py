@@ -0,0 +1,220 @@
+"""
+Compact columnar data model for the recommendation job.
+
+Instead of passing lists of row dicts around, the job works on:
+- Interner: uuid -> dense int32 code, stable for the life of the process
+- JobData: the fetched tables as NumPy columns, with memberships in CSR
+  form (indptr by user code -> group ids in table order); upcoming events
+  live in event_index.EventIndex, which persists between runs
+- RecommendationBatch: one row per recommendation as parallel arrays
+  (user code, entity type code, entity id, score, rank) plus a single
+  per-run metadata record; "user" entities store the suggested user's
+  interner code as entity id
+
+Rows are only turned back into dicts at the output boundary (Supabase
+writes, cache, HTTP) via RecommendationBatch.to_rows().
+"""
+import math
+import threading
+from datetime import datetime
+
+import numpy as np
+
+ENTITY_TYPES = ("user", "group", "event")
+ENTITY_CODES = {name: code for code, name in enumerate(ENTITY_TYPES)}
+
+
+def parse_timestamp(value):
+    """ISO string / datetime / None -> epoch seconds (NaN when missing or invalid)."""
+    if value is None:
+        return math.nan
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return math.nan
+
+
+class Interner:
+    """Maps opaque ids (uuids) to dense int codes and back.
+
+    Thread-safe: the batch job and the interaction stream intern concurrently.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(value)
+                if code is None:
+                    code = len(self.values)
+                    self.values.append(value)
+                    self.codes[value] = code
+        return code
+
+    def intern_many(self, values):
+        return np.fromiter((self.intern(v) for v in values), dtype=np.int32)
+
+    def decode(self, code):
+        return self.values[code]
+
+
+class JobData:
+    """One run's worth of Supabase tables in columnar form."""
+
+    def __init__(self, interner, user_codes, group_ids, member_indptr, member_groups,
+                 member_user_codes, member_created_at, interests, user_private=None):
+        self.interner = interner
+        self.user_codes = user_codes
+        # Aligned with user_codes: users.visibility == 'private' (hidden from other users)
+        self.user_private = user_private if user_private is not None else np.zeros(len(user_codes), dtype=bool)
+        self.group_ids = group_ids
+        self.member_indptr = member_indptr
+        self.member_groups = member_groups
+        self.member_user_codes = member_user_codes
+        self.member_created_at = member_created_at
+        # user code -> list of interest names (only users that have any)
+        self.interests = interests
+
+    @classmethod
+    def from_rows(cls, users, groups, memberships, user_interests_map, interner=None):
+        interner = interner if interner is not None else Interner()
+        user_codes = interner.intern_many(u["id"] for u in users)
+        user_private = np.fromiter((u.get("visibility") == "private" for u in users), dtype=bool, count=len(users))
+        group_ids = np.fromiter((int(g["id"]) for g in groups), dtype=np.int64, count=len(groups))
+
+        m_users = interner.intern_many(m["user_id"] for m in memberships)
+        m_groups = np.fromiter((int(m["group_id"]) for m in memberships), dtype=np.int64, count=len(memberships))
+        m_created = np.fromiter((parse_timestamp(m.get("created_at")) for m in memberships),
+                                dtype=np.float64, count=len(memberships))
+        # Stable sort keeps each user's memberships in table order (used as the interaction sequence)
+        order = np.argsort(m_users, kind="stable")
+        counts = np.bincount(m_users, minlength=len(interner))
+        indptr = np.zeros(len(interner) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        interests = {interner.intern(uid): names for uid, names in (user_interests_map or {}).items() if names}
+
+        return cls(interner, user_codes, group_ids, indptr, m_groups[order], m_users[order],
+                   m_created[order], interests, user_private)
+
+    @property
+    def num_users(self):
+        return len(self.user_codes)
+
+    def groups_of(self, user_code):
+        """Group ids the user belongs to, in membership table order."""
+        if user_code + 1 >= len(self.member_indptr):
+            return self.member_groups[:0]
+        return self.member_groups[self.member_indptr[user_code]:self.member_indptr[user_code + 1]]
+
+
+class RecommendationBatch:
+    """Recommendations as parallel arrays with one metadata record per run."""
+
+    def __init__(self, interner, user_codes, entity_types, entity_ids, scores, ranks, meta=None):
+        self.interner = interner
+        self.user_codes = user_codes
+        self.entity_types = entity_types
+        self.entity_ids = entity_ids
+        self.scores = scores
+        self.ranks = ranks
+        self.meta = meta or {}
+        self._size = len(user_codes)
+
+    @classmethod
+    def allocate(cls, interner, capacity, meta=None):
+        """Preallocated, zero-length batch that `append_topk` fills in place."""
+        batch = cls(
+            interner,
+            np.empty(capacity, dtype=np.int32),
+            np.empty(capacity, dtype=np.int8),
+            np.empty(capacity, dtype=np.int64),
+            np.empty(capacity, dtype=np.float32),
+            np.empty(capacity, dtype=np.int16),
+            meta,
+        )
+        batch._size = 0
+        return batch
+
+    @classmethod
+    def empty(cls, interner, meta=None):
+        return cls.allocate(interner, 0, meta)
+
+    def append_topk(self, user_codes, entity_type, entity_ids, scores, counts):
+        """Append a (B, k) block of ranked results, keeping the first counts[b] of each row."""
+        keep = np.arange(entity_ids.shape[1]) < np.asarray(counts)[:, None]
+        n = int(keep.sum())
+        start, end = self._size, self._size + n
+        self.user_codes[start:end] = np.broadcast_to(np.asarray(user_codes)[:, None], keep.shape)[keep]
+        self.entity_types[start:end] = ENTITY_CODES[entity_type]
+        self.entity_ids[start:end] = entity_ids[keep]
+        self.scores[start:end] = scores[keep]
+        self.ranks[start:end] = np.broadcast_to(np.arange(1, keep.shape[1] + 1), keep.shape)[keep]
+        self._size = end
+
+    def trim(self):
+        """Drop unused preallocated capacity."""
+        n = self._size
+        for name in ("user_codes", "entity_types", "entity_ids", "scores", "ranks"):
+            setattr(self, name, getattr(self, name)[:n])
+        return self
+
+    def __len__(self):
+        return self._size
+
+    def concat(self, other):
+        a, b = self.trim(), other.trim()
+        return RecommendationBatch(
+            self.interner,
+            np.concatenate([a.user_codes, b.user_codes]),
+            np.concatenate([a.entity_types, b.entity_types]),
+            np.concatenate([a.entity_ids, b.entity_ids]),
+            np.concatenate([a.scores, b.scores]),
+            np.concatenate([a.ranks, b.ranks]),
+            {**other.meta, **self.meta},
+        )
+
+    def select(self, mask):
+        self.trim()
+        return RecommendationBatch(
+            self.interner, self.user_codes[mask], self.entity_types[mask],
+            self.entity_ids[mask], self.scores[mask], self.ranks[mask], self.meta,
+        )
+
+    def of_type(self, entity_type):
+        self.trim()
+        return self.select(self.entity_types == ENTITY_CODES[entity_type])
+
+    def user_ids(self):
+        self.trim()
+        return [self.interner.decode(c) for c in np.unique(self.user_codes).tolist()]
+
+    def to_rows(self, start=0, stop=None):
+        """Yield plain dict rows for [start, stop) — the output boundary."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        decode = self.interner.decode
+        user_type = ENTITY_CODES["user"]
+        for code, etype, eid, score, rank in zip(
+            self.user_codes[start:stop].tolist(),
+            self.entity_types[start:stop].tolist(),
+            self.entity_ids[start:stop].tolist(),
+            self.scores[start:stop].tolist(),
+            self.ranks[start:stop].tolist(),
+        ):
+            yield {
+                "user_id": decode(code),
+                "entity_type": ENTITY_TYPES[etype],
+                "entity_id": decode(eid) if etype == user_type else eid,
+                "score": score,
+                "rank": rank,
+            }
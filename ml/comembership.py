@@ -0,0 +1,171 @@
+"""
+Co-membership and popularity candidate generator.
+
+Built from `group_members` and kept up to date incrementally:
+- Sparse group x group co-occurrence counts (dict of Counters): two groups
+  co-occur once for every user who belongs to both.
+- Time-decayed popularity per group: every join adds 1, decaying with a
+  configurable half-life.
+
+Used to serve cold-start users without touching the DQN and to supply
+extra candidates that are blended with QNetwork scores.
+
+Thread-safe: the interaction stream applies joins/leaves while the batch
+job syncs and scores, so every update and read holds one lock (sync holds
+it for the whole diff).
+"""
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+
+def _as_list(values):
+    return values.tolist() if isinstance(values, np.ndarray) else list(values)
+
+
+class CoMembershipEngine:
+    """Incrementally maintained co-occurrence graph and popularity ranking."""
+
+    def __init__(self, half_life_days=14.0):
+        self.decay_rate = math.log(2) / (half_life_days * 86400.0)
+        self.user_groups = defaultdict(set)
+        self.cooccurrence = defaultdict(Counter)
+        self.joined_at = {}
+        # group_id -> (decayed score, timestamp it was last brought up to date)
+        self.popularity = {}
+        self._popular_ranking = None
+        self._lock = threading.RLock()
+
+    # -----------------------------
+    # Incremental updates
+    # -----------------------------
+    def add_membership(self, user_id, group_id, ts=None):
+        with self._lock:
+            return self._add(user_id, group_id, ts)
+
+    def remove_membership(self, user_id, group_id):
+        with self._lock:
+            return self._remove(user_id, group_id)
+
+    def _add(self, user_id, group_id, ts):
+        groups = self.user_groups[user_id]
+        if group_id in groups:
+            return False
+        ts = ts if ts is not None else time.time()
+        for other in groups:
+            self.cooccurrence[group_id][other] += 1
+            self.cooccurrence[other][group_id] += 1
+        groups.add(group_id)
+        self.joined_at[(user_id, group_id)] = ts
+        self._bump_popularity(group_id, ts, 1.0)
+        return True
+
+    def _remove(self, user_id, group_id):
+        groups = self.user_groups.get(user_id)
+        if not groups or group_id not in groups:
+            return False
+        groups.discard(group_id)
+        for other in groups:
+            for a, b in ((group_id, other), (other, group_id)):
+                row = self.cooccurrence[a]
+                row[b] -= 1
+                if row[b] <= 0:
+                    del row[b]
+        ts = self.joined_at.pop((user_id, group_id), None)
+        if ts is not None:
+            self._bump_popularity(group_id, ts, -1.0)
+        if not groups:
+            del self.user_groups[user_id]
+        return True
+
+    def sync(self, user_ids, group_ids, joined_at):
+        """Apply the diff between the known memberships and a fresh table snapshot.
+
+        Takes parallel columns (user, group, join epoch seconds or NaN). Only
+        added/removed pairs are touched, so an hourly job costs O(changes)
+        in co-occurrence updates rather than a full rebuild.
+        """
+        current = {}
+        for user_id, group_id, ts in zip(_as_list(user_ids), _as_list(group_ids), _as_list(joined_at)):
+            current[(user_id, group_id)] = None if ts is None or math.isnan(ts) else ts
+        with self._lock:
+            removed = [key for key in self.joined_at if key not in current]
+            for user_id, group_id in removed:
+                self._remove(user_id, group_id)
+            added = 0
+            for (user_id, group_id), ts in current.items():
+                if self._add(user_id, group_id, ts):
+                    added += 1
+        return added, len(removed)
+
+    def groups_of(self, user_id):
+        """Sorted group ids the user currently belongs to."""
+        with self._lock:
+            return sorted(self.user_groups.get(user_id, ()))
+
+    def _bump_popularity(self, group_id, ts, weight):
+        score, ref = self.popularity.get(group_id, (0.0, ts))
+        if ts >= ref:
+            score = score * math.exp(-self.decay_rate * (ts - ref)) + weight
+            ref = ts
+        else:
+            score += weight * math.exp(-self.decay_rate * (ref - ts))
+        self.popularity[group_id] = (max(score, 0.0), ref)
+        self._popular_ranking = None
+
+    # -----------------------------
+    # Scoring
+    # -----------------------------
+    def popular_ranking(self, now=None):
+        """(group_ids, scores) sorted by decayed popularity, cached until the next update."""
+        with self._lock:
+            if self._popular_ranking is None:
+                now = now if now is not None else time.time()
+                ids = np.fromiter(self.popularity.keys(), dtype=np.int64, count=len(self.popularity))
+                scores = np.fromiter(
+                    (s * math.exp(-self.decay_rate * max(now - ref, 0.0)) for s, ref in self.popularity.values()),
+                    dtype=np.float32,
+                    count=len(self.popularity),
+                )
+                order = np.argsort(-scores, kind="stable")
+                self._popular_ranking = (ids[order], scores[order])
+            return self._popular_ranking
+
+    def comembership_scores(self, group_ids):
+        """Counter of group_id -> summed co-occurrence with `group_ids`, excluding them."""
+        totals = Counter()
+        with self._lock:
+            for gid in group_ids:
+                totals.update(self.cooccurrence.get(gid, {}))
+        for gid in group_ids:
+            totals.pop(gid, None)
+        return totals
+
+    def dense_comembership(self, user_group_ids, size):
+        """Co-membership scores as a dense array indexed by group_id - 1, scaled to [0, 1]."""
+        co = np.zeros(size, dtype=np.float32)
+        for gid, count in self.comembership_scores(user_group_ids).items():
+            if 1 <= gid <= size:
+                co[gid - 1] = count
+        peak = co.max() if size else 0.0
+        if peak > 0:
+            co /= peak
+        return co
+
+    def dense_popularity(self, size):
+        """Popularity as a dense array indexed by group_id - 1, scaled to [0, 1].
+
+        Ordering of decayed scores does not depend on "now" (every group
+        decays by the same factor), so one array serves a whole batch.
+        """
+        pop = np.zeros(size, dtype=np.float32)
+        ids, scores = self.popular_ranking()
+        in_range = (ids >= 1) & (ids <= size)
+        pop[ids[in_range] - 1] = scores[in_range]
+        peak = pop.max() if size else 0.0
+        if peak > 0:
+            pop /= peak
+        return pop
@@ -5,6 +5,8 @@ import torch.nn as nn
 import torch.optim as optim
 from collections import deque
 
+from profiling import label
+
 # -----------------------------
 # Q-Network
 # -----------------------------
@@ -47,6 +49,32 @@ class ReplayBuffer:
     def __len__(self):
         return len(self.buffer)
 
+    def snapshot(self):
+        """Buffer contents as stacked NumPy arrays (oldest first), for checkpointing."""
+        if not self.buffer:
+            return {"capacity": np.array(self.buffer.maxlen)}
+        states, actions, rewards, next_states, dones = zip(*self.buffer)
+        return {
+            "capacity": np.array(self.buffer.maxlen),
+            "states": torch.cat(states).cpu().numpy(),
+            "actions": np.array(actions, dtype=np.int64),
+            "rewards": np.array(rewards, dtype=np.float64),
+            "next_states": torch.cat(next_states).cpu().numpy(),
+            "dones": np.array(dones, dtype=bool),
+        }
+
+    def restore(self, arrays, device="cpu"):
+        """Rebuild the buffer from `snapshot()` output, preserving order and element types."""
+        self.buffer = deque(maxlen=int(arrays["capacity"]))
+        if "states" not in arrays:
+            return
+        states = torch.from_numpy(arrays["states"]).to(device)
+        next_states = torch.from_numpy(arrays["next_states"]).to(device)
+        for i, (action, reward, done) in enumerate(zip(
+            arrays["actions"].tolist(), arrays["rewards"].tolist(), arrays["dones"].tolist()
+        )):
+            self.buffer.append((states[i:i + 1], action, reward, next_states[i:i + 1], done))
+
 
 # -----------------------------
 # DQN Agent
@@ -83,6 +111,30 @@ class DQNAgent:
         self.step_count = 0
         self.action_dim = action_dim
 
+    def state_dict(self):
+        """Detached copies of everything needed to resume training (buffer excluded)."""
+        def clone(tree):
+            return {k: clone(v) if isinstance(v, dict) else v.detach().cpu().clone() if torch.is_tensor(v) else v
+                    for k, v in tree.items()}
+        optimizer_state = self.optimizer.state_dict()
+        return {
+            "q_net": clone(self.q_net.state_dict()),
+            "target_net": clone(self.target_net.state_dict()),
+            "optimizer": {
+                "state": {k: clone(v) for k, v in optimizer_state["state"].items()},
+                "param_groups": [dict(g) for g in optimizer_state["param_groups"]],
+            },
+            "epsilon": self.epsilon,
+            "step_count": self.step_count,
+        }
+
+    def load_state_dict(self, state):
+        self.q_net.load_state_dict(state["q_net"])
+        self.target_net.load_state_dict(state["target_net"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.epsilon = state["epsilon"]
+        self.step_count = state["step_count"]
+
     def select_action(self, state):
         if random.random() < self.epsilon:
             return random.randrange(self.action_dim)
@@ -102,17 +154,20 @@ class DQNAgent:
         rewards = rewards.to(self.device)
         dones = dones.to(self.device)
 
-        q_values = self.q_net(states).gather(1, actions.unsqueeze(1)).squeeze(1)
+        # Labels show up in torch.profiler traces (see profiling.py)
+        with label("dqn.forward"):
+            q_values = self.q_net(states).gather(1, actions.unsqueeze(1)).squeeze(1)
 
-        with torch.no_grad():
-            next_q_values = self.target_net(next_states).max(1)[0]
-            target_q = rewards + self.gamma * next_q_values * (1 - dones)
+            with torch.no_grad():
+                next_q_values = self.target_net(next_states).max(1)[0]
+                target_q = rewards + self.gamma * next_q_values * (1 - dones)
 
-        loss = nn.MSELoss()(q_values, target_q)
+            loss = nn.MSELoss()(q_values, target_q)
 
-        self.optimizer.zero_grad()
-        loss.backward()
-        self.optimizer.step()
+        with label("dqn.backward"):
+            self.optimizer.zero_grad()
+            loss.backward()
+            self.optimizer.step()
 
         # epsilon decay
         self.epsilon = max(self.epsilon_end, self.epsilon * self.epsilon_decay)
@@ -0,0 +1,133 @@
+"""
+Upcoming-event index maintained between recommendation runs.
+
+Only events inside the window [now, now + horizon] are fetched and held,
+so the cost of event recommendations depends on upcoming volume rather
+than on every event ever created. The index keeps events sorted by
+(group, time) with per-group spans and decay factors precomputed at each
+refresh, so synthesis is a slice lookup per recommended group.
+
+Refresh modes:
+- full: reload the whole window (picks up edits and deletes)
+- incremental: fetch events created since the last high-water mark
+  (created_at, with a small overlap for late commits), plus events whose
+  time has slid into the window since the last refresh; expired events
+  are pruned locally
+"""
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from columnar import parse_timestamp
+
+EVENT_HORIZON_DAYS = float(os.getenv("ML_EVENT_HORIZON_DAYS", 90))
+EVENT_DECAY_DAYS = float(os.getenv("ML_EVENT_DECAY_DAYS", 30))
+# Re-read this many seconds before the created_at high-water mark, for rows
+# whose transaction committed after a later-stamped one was already seen
+EVENT_INDEX_OVERLAP_SECONDS = float(os.getenv("ML_EVENT_INDEX_OVERLAP_SECONDS", 300))
+
+COLUMNS = "id, group_id, time, created_at"
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class EventIndex:
+    """Upcoming events per group, sorted soonest first, with decay factors."""
+
+    def __init__(self, horizon_days=EVENT_HORIZON_DAYS, decay_days=EVENT_DECAY_DAYS,
+                 overlap_seconds=EVENT_INDEX_OVERLAP_SECONDS):
+        self.horizon_seconds = horizon_days * 86400.0
+        self.decay_seconds = decay_days * 86400.0
+        self.overlap_seconds = overlap_seconds
+        # event id -> (group id, epoch time) for events inside the window
+        self._events = {}
+        self.high_water = None
+        self.loaded_until = None
+        self.refreshed_at = None
+        self.last_refresh = None
+        self._build(time.time())
+        self.refreshed_at = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self, store, full=False, now=None):
+        """Bring the index up to date; returns the number of rows fetched."""
+        now = time.time() if now is None else now
+        window_end = now + self.horizon_seconds
+        started = time.perf_counter()
+
+        if full or self.high_water is None:
+            rows = store.select_all("events", COLUMNS, order="id",
+                                    filters={"time": [f"gte.{_iso(now)}", f"lte.{_iso(window_end)}"]})
+            self._events = {}
+            mode = "full"
+        else:
+            # Newly created events inside the window
+            rows = store.select_all("events", COLUMNS, order="created_at,id", filters={
+                "created_at": f"gte.{_iso(self.high_water - self.overlap_seconds)}",
+                "time": [f"gte.{_iso(now)}", f"lte.{_iso(window_end)}"],
+            })
+            # Older events whose time has moved into the window since the last refresh
+            if window_end > self.loaded_until:
+                rows += store.select_all("events", COLUMNS, order="id", filters={
+                    "time": [f"gt.{_iso(self.loaded_until)}", f"lte.{_iso(window_end)}"],
+                })
+            mode = "incremental"
+
+        for row in rows:
+            created = parse_timestamp(row.get("created_at"))
+            if not math.isnan(created) and (self.high_water is None or created > self.high_water):
+                self.high_water = created
+            if row.get("group_id") is None:
+                continue
+            self._events[int(row["id"])] = (int(row["group_id"]), parse_timestamp(row.get("time")))
+        if self.high_water is None:
+            self.high_water = now
+        self.loaded_until = window_end
+
+        self._build(now)
+        self.last_refresh = {
+            "mode": mode,
+            "fetched": len(rows),
+            "indexed": len(self),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        return len(rows)
+
+    def _build(self, now):
+        """Prune expired events and lay the rest out sorted by (group, time)."""
+        self._events = {eid: (g, t) for eid, (g, t) in self._events.items() if t >= now}
+        n = len(self._events)
+        ids = np.fromiter(self._events.keys(), dtype=np.int64, count=n)
+        groups = np.fromiter((g for g, _ in self._events.values()), dtype=np.int64, count=n)
+        times = np.fromiter((t for _, t in self._events.values()), dtype=np.float64, count=n)
+        order = np.lexsort((ids, times, groups))
+        self.ids = ids[order]
+        self.group_ids = groups[order]
+        self.times = times[order]
+        self.decay = np.exp(-(self.times - now) / self.decay_seconds).astype(np.float32)
+        keys, starts, counts = np.unique(self.group_ids, return_index=True, return_counts=True)
+        self.spans = {
+            g: (start, start + count)
+            for g, start, count in zip(keys.tolist(), starts.tolist(), counts.tolist())
+        }
+        self.refreshed_at = now
+
+    def span(self, group_id):
+        """(start, end) slice of this group's events in ids/decay, or None."""
+        return self.spans.get(group_id)
+
+    def stats(self):
+        return {
+            "events": len(self),
+            "groups": len(self.spans),
+            "horizon_days": self.horizon_seconds / 86400.0,
+            "refreshed_at": _iso(self.refreshed_at) if self.refreshed_at else None,
+            "last_refresh": self.last_refresh,
+        }
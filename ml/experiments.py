@@ -0,0 +1,247 @@
+"""
+Shadow scoring and A/B assignment for the batch job.
+
+ML_SHADOW_MODELS lists DQN checkpoints scored alongside the primary model:
+
+    ML_SHADOW_MODELS="v2=models/dqn_v2.pth:0.1,v3=models/dqn_v3.pth"
+
+Each entry is name=path[:share]. `share` is the fraction of users whose
+written recommendations come from that variant. The default share of 0
+means shadow only: the variant is scored and compared but never written.
+The primary variant gets the remaining users. Users are assigned by
+hashing their id with ML_EXPERIMENT_SALT, so a user stays in the same
+variant across runs and restarts until the salt or the shares change.
+
+Every variant scores the same state tensor, so state building (most of
+the scoring cost) is done once, as is the co-membership/popularity part
+of the blended score. Each model then runs its own forward pass over that
+tensor. A stacked forward (torch.func.stack_module_state + vmap) gives
+bitwise-identical Q-values but is slower on CPU for QNetwork-sized models;
+bench_shadow.py compares the two. ExperimentStats collects:
+- per variant: the top-k score distribution and ranking time
+- per shadow variant: top-k overlap and top-1 agreement with the primary
+- shared time (state building, blend base) and the time of all forwards
+"""
+import hashlib
+import os
+
+import numpy as np
+
+PRIMARY = "primary"
+SHADOW_MODELS = os.getenv("ML_SHADOW_MODELS", "")
+EXPERIMENT_SALT = os.getenv("ML_EXPERIMENT_SALT", "reco-ab-1")
+HISTOGRAM_BINS = int(os.getenv("ML_EXPERIMENT_HISTOGRAM_BINS", 20))
+# Scores are counted in this many sub-bins per reported bin, for quantiles
+HISTOGRAM_SUBBINS = 50
+
+
+def parse_variants(spec):
+    """'name=path[:share],...' -> list of (name, path, share)."""
+    variants = []
+    for entry in filter(None, (e.strip() for e in (spec or "").split(","))):
+        name, sep, rest = entry.partition("=")
+        if not sep or not name.strip() or not rest.strip():
+            raise ValueError(f"Invalid shadow model entry '{entry}'; expected name=path[:share]")
+        path, share = rest, 0.0
+        head, sep, tail = rest.rpartition(":")
+        if sep:
+            try:
+                path, share = head, float(tail)
+            except ValueError:
+                pass  # a ':' inside the path, not a share
+        name = name.strip()
+        if name == PRIMARY or any(name == v[0] for v in variants):
+            raise ValueError(f"Duplicate variant name '{name}'")
+        if not 0.0 <= share <= 1.0:
+            raise ValueError(f"Share for '{name}' must be in [0, 1], got {share}")
+        variants.append((name, path.strip(), share))
+    if sum(share for _, _, share in variants) > 1.0 + 1e-9:
+        raise ValueError("Shadow model shares add up to more than 1")
+    return variants
+
+
+def hash_bucket(user_id, salt=EXPERIMENT_SALT):
+    """Stable position of a user in [0, 1), independent of process and run."""
+    digest = hashlib.blake2b(f"{salt}:{user_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2.0 ** 64
+
+
+class Experiment:
+    """Variant names and shares, and the stable user -> variant assignment.
+
+    Variant 0 is always the primary model; shadows follow in the order given.
+    """
+
+    def __init__(self, names, shares, salt=EXPERIMENT_SALT):
+        self.names = [PRIMARY] + list(names)
+        self.shares = [1.0 - sum(shares)] + list(shares)
+        self.salt = salt
+        # Upper bucket bound per variant; shadows take the low end of [0, 1)
+        self._bounds = np.cumsum(list(shares) + [1.0])
+        self._order = list(range(1, len(self.names))) + [0]
+        # user code -> variant index (codes are stable for the process)
+        self._assigned = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def assign(self, interner, user_codes):
+        """Variant index per user code (int8 array aligned with `user_codes`)."""
+        out = np.empty(len(user_codes), dtype=np.int8)
+        cache = self._assigned
+        for i, code in enumerate(np.asarray(user_codes).tolist()):
+            variant = cache.get(code)
+            if variant is None:
+                variant = cache[code] = self.variant_of(interner.decode(code))
+            out[i] = variant
+        return out
+
+    def variant_of(self, user_id):
+        """Variant index for one user id (uncached, for ids that are not interned)."""
+        slot = int(np.searchsorted(self._bounds, hash_bucket(user_id, self.salt), side="right"))
+        return self._order[min(slot, len(self._order) - 1)]
+
+    def info(self):
+        return {"salt": self.salt, "variants": dict(zip(self.names, (round(s, 6) for s in self.shares)))}
+
+
+class ExperimentStats:
+    """Per-run comparison of variants scored on the same users.
+
+    Memory does not grow with the number of users. Each chunk's scores are
+    folded into running moments and fixed-edge histograms. The edges span
+    `score_range` when the score scale is known; blended scores lie in
+    [0, 1]. Otherwise the first chunk fixes them: its range, padded by that
+    range on each side. Scores outside the edges count as underflow or
+    overflow. Quantiles are interpolated from a finer histogram
+    (HISTOGRAM_SUBBINS per reported bin).
+    """
+
+    def __init__(self, experiment, k, score_range=None, bins=HISTOGRAM_BINS):
+        self.experiment = experiment
+        self.k = k
+        self.bins = bins
+        self.fine_bins = bins * HISTOGRAM_SUBBINS
+        self.edges = np.linspace(*score_range, self.fine_bins + 1) if score_range is not None else None
+        n = len(experiment)
+        # [underflow, fine bins..., overflow] per variant
+        self.histograms = np.zeros((n, self.fine_bins + 2), dtype=np.int64)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.total = np.zeros(n)
+        self.total_sq = np.zeros(n)
+        self.low = np.full(n, np.inf)
+        self.high = np.full(n, -np.inf)
+        self.rank_seconds = np.zeros(n)
+        self.forward_seconds = 0.0
+        self.shared_seconds = 0.0
+        self.assigned = np.zeros(n, dtype=np.int64)
+        self.overlap_sum = np.zeros(n)
+        self.top1_agree = np.zeros(n, dtype=np.int64)
+        self.compared = np.zeros(n, dtype=np.int64)
+
+    def record(self, results, assigned, rows):
+        """Add one chunk.
+
+        Args:
+            results: per-variant (indices, scores, counts) for the whole chunk
+            assigned: per-row variant index for the chunk
+            rows: chunk rows scored by the models (cold-start rows are
+                identical across variants and left out of the comparison)
+        """
+        self.assigned += np.bincount(assigned, minlength=len(self.assigned))
+        if not len(rows):
+            return
+        base_idx, _, base_counts = (r[rows] for r in results[0])
+        base_valid = np.arange(base_idx.shape[1]) < base_counts[:, None]
+        chunk_scores = []
+        for indices, scores, counts in results:
+            valid = np.arange(scores.shape[1]) < counts[rows][:, None]
+            values = scores[rows][valid].astype(np.float64)
+            chunk_scores.append(values[np.isfinite(values)])
+        if self.edges is None:
+            self._fix_edges(np.concatenate(chunk_scores))
+
+        for v, (indices, scores, counts) in enumerate(results):
+            self._add_scores(v, chunk_scores[v])
+            if v == 0:
+                continue
+            indices, counts = indices[rows], counts[rows]
+            valid = np.arange(indices.shape[1]) < counts[:, None]
+            hits = (indices[:, :, None] == base_idx[:, None, :]) & valid[:, :, None] & base_valid[:, None, :]
+            denom = np.maximum(np.minimum(counts, base_counts), 1)
+            self.overlap_sum[v] += (hits.any(axis=2).sum(axis=1) / denom).sum()
+            both = (counts > 0) & (base_counts > 0)
+            self.top1_agree[v] += int((both & (indices[:, 0] == base_idx[:, 0])).sum())
+            self.compared[v] += len(rows)
+
+    def _fix_edges(self, values):
+        if not len(values):
+            return
+        low, high = float(values.min()), float(values.max())
+        span = high - low if high > low else 1.0
+        self.edges = np.linspace(low - span, high + span, self.fine_bins + 1)
+
+    def _add_scores(self, v, values):
+        if not len(values):
+            return
+        self.count[v] += len(values)
+        self.total[v] += values.sum()
+        self.total_sq[v] += np.square(values).sum()
+        self.low[v] = min(self.low[v], values.min())
+        self.high[v] = max(self.high[v], values.max())
+        slots = np.searchsorted(self.edges, values, side="right")
+        slots[values == self.edges[-1]] = self.fine_bins  # closed last bin, as np.histogram
+        self.histograms[v] += np.bincount(slots, minlength=self.fine_bins + 2)
+
+    def _quantiles(self, v, qs=(0.1, 0.5, 0.9)):
+        """Quantiles interpolated within histogram bins; under/overflow span out to the observed min/max."""
+        bounds = np.concatenate([[min(self.low[v], self.edges[0])], self.edges, [max(self.high[v], self.edges[-1])]])
+        cumulative = np.cumsum(self.histograms[v])
+        out = []
+        for q in qs:
+            target = q * cumulative[-1]
+            b = int(np.searchsorted(cumulative, target, side="left"))
+            before = cumulative[b - 1] if b > 0 else 0
+            inside = self.histograms[v][b]
+            frac = (target - before) / inside if inside else 0.0
+            value = bounds[b] + frac * (bounds[b + 1] - bounds[b])
+            out.append(float(np.clip(value, self.low[v], self.high[v])))
+        return dict(zip((f"p{round(q * 100)}" for q in qs), out))
+
+    def summary(self):
+        variants = {}
+        for v, name in enumerate(self.experiment.names):
+            n = int(self.count[v])
+            mean = self.total[v] / n if n else None
+            entry = {
+                "share": round(self.experiment.shares[v], 6),
+                "assigned_users": int(self.assigned[v]),
+                "rank_seconds": round(float(self.rank_seconds[v]), 4),
+                "scores": {
+                    "count": n,
+                    "mean": float(mean) if n else None,
+                    "std": float(np.sqrt(max(self.total_sq[v] / n - mean * mean, 0.0))) if n else None,
+                    "min": float(self.low[v]) if n else None,
+                    "max": float(self.high[v]) if n else None,
+                    "quantiles": self._quantiles(v) if n else None,
+                    "histogram": self.histograms[v, 1:-1].reshape(self.bins, -1).sum(axis=1).tolist(),
+                    "underflow": int(self.histograms[v, 0]),
+                    "overflow": int(self.histograms[v, -1]),
+                },
+            }
+            if v > 0:
+                compared = int(self.compared[v])
+                entry["vs_primary"] = {
+                    "users": compared,
+                    f"overlap@{self.k}": round(float(self.overlap_sum[v] / compared), 4) if compared else None,
+                    "top1_agreement": round(float(self.top1_agree[v] / compared), 4) if compared else None,
+                }
+            variants[name] = entry
+
+        return {
+            **self.experiment.info(),
+            "shared_seconds": round(self.shared_seconds, 4),
+            "forward_seconds": round(self.forward_seconds, 4),
+            "histogram_edges": self.edges[::HISTOGRAM_SUBBINS].tolist() if self.edges is not None else [],
+            "by_variant": variants,
+        }
@@ -2,6 +2,7 @@ import torch
 import numpy as np
 from reco_env import SequentialRecEnv
 from dqn_agent import QNetwork
+from topk import topk_with_exclusions
 
 # -----------------------------
 # State preprocessing (same as training)
@@ -44,15 +45,13 @@ def recommend_top_k(obs, env, model, k=5):
     state = preprocess_obs(obs, env, device)
 
     with torch.no_grad():
-        q_values = model(state).squeeze(0)
+        q_values = model(state).cpu().numpy()
 
     # Exclude already-seen groups
-    seen_groups = set(obs[env.embed_dim:].astype(int).tolist())
-    for g in seen_groups:
-        q_values[g] = -1e9  # mask seen items
-
-    top_k = torch.topk(q_values, k).indices.tolist()
-    return top_k
+    seen_groups = np.unique(obs[env.embed_dim:].astype(int))
+    indptr = np.array([0, len(seen_groups)])
+    top_k, _, count = topk_with_exclusions(q_values, k, indptr, seen_groups)
+    return top_k[0, :count[0]].tolist()
 
 
 # -----------------------------
@@ -3,20 +3,49 @@ Continuously running ML recommendation service.
 
 This Flask service:
 1. Runs in the background
-2. Automatically regenerates recommendations every hour
-3. Provides API endpoints for manual triggers and health checks
+2. Regenerates group, event and people (user-to-user) recommendations on
+   a schedule (hourly full run, frequent incremental runs for users whose
+   memberships/interests changed)
+3. Provides API endpoints for manual triggers, cancellation and health checks
 4. Pushes results directly to Supabase recommendations_metadata table
+5. Serves each user's latest recommendations from an in-memory cache
+   (ETag/If-None-Match, LRU + TTL) with invalidation hooks for the app
+6. Tails the interactions table to keep per-user sequences fresh for
+   online scoring between batch runs
+7. Profiles the next job on request (POST /profile; see profiling.py)
+8. Scores shadow models next to the primary one and writes each user's
+   assigned variant (ML_SHADOW_MODELS; see experiments.py)
+
+All Supabase access goes through one pooled, retrying `SupabaseStore`
+(see supabase_store.py); per-operation latency histograms are on /status.
+
+Startup is kept fast: torch/the model (via `recommender`) and the HTTP
+client are imported on first use, and gymnasium is never imported on the
+serving path. Run with `--warmup` to load the model and push a dummy batch
+through it before serving, or `--lazy` to defer model loading to the
+first job. Phase timings are reported on /status.
 """
+import time
+
+_PROCESS_T0 = time.perf_counter()
+
+import argparse
+import hashlib
 import os
 import threading
-import time
 from datetime import datetime
-from flask import Flask, jsonify
+import numpy as np
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
-from supabase import create_client
 
-from recommender import RecommendationEngine
+from columnar import ENTITY_CODES, JobData, RecommendationBatch
+from event_index import EventIndex
+from profiling import ProfileSession, parse_profilers
+from reco_cache import ENTITY_TYPES, RecommendationCache
+from scheduler import JobCancelled, JobScheduler, Schedule
+from supabase_store import get_store
+from topk import topk_with_exclusions
 
 # Load environment variables
 load_dotenv(dotenv_path="../.env.local")
@@ -24,172 +53,357 @@ load_dotenv(dotenv_path="../.env.local")
 app = Flask(__name__)
 CORS(app)
 
+# Scheduler configuration
+FULL_INTERVAL_SECONDS = int(os.getenv("ML_FULL_INTERVAL_SECONDS", 3600))
+INCREMENTAL_INTERVAL_SECONDS = int(os.getenv("ML_INCREMENTAL_INTERVAL_SECONDS", 900))
+# Shifts incremental slots off the full-run boundaries (both are aligned to
+# epoch multiples), so no incremental run fires right next to a full one
+INCREMENTAL_OFFSET_SECONDS = int(os.getenv("ML_INCREMENTAL_OFFSET_SECONDS", INCREMENTAL_INTERVAL_SECONDS // 2))
+SCHEDULE_JITTER_SECONDS = int(os.getenv("ML_SCHEDULE_JITTER_SECONDS", 60))
+JOB_TIMEOUT_SECONDS = int(os.getenv("ML_JOB_TIMEOUT_SECONDS", 1800))
+
+# Recommendation cache configuration
+CACHE_MAX_USERS = int(os.getenv("ML_CACHE_MAX_USERS", 50000))
+CACHE_TTL_SECONDS = int(os.getenv("ML_CACHE_TTL_SECONDS", 7200))
+
+# Interaction stream configuration
+STREAM_INTERACTIONS = os.getenv("ML_STREAM_INTERACTIONS", "1") == "1"
+STREAM_POLL_SECONDS = float(os.getenv("ML_STREAM_POLL_SECONDS", 5))
+
+# User-to-user suggestions, written alongside group/event recommendations
+PEOPLE_MATCHING = os.getenv("ML_PEOPLE_MATCHING", "1") == "1"
+
+# Cache misses are read on the request path: fail fast rather than back off
+CACHE_LOAD_TIMEOUT_SECONDS = float(os.getenv("ML_CACHE_LOAD_TIMEOUT_SECONDS", 5))
+
 # Global state
 engine = None
+interaction_stream = None
+# Set under --lazy: start the interaction stream once the engine loads
+stream_on_engine_load = False
+# event id -> group id for the events currently in event_index (rebuilt by each job),
+# used to attribute event interactions
+event_groups = {}
+# upcoming events, refreshed incrementally by each job (full jobs reload the window)
+event_index = EventIndex()
+_engine_lock = threading.Lock()
+# phase -> seconds, reported on /status
+startup_timings = {"service_imports": round(time.perf_counter() - _PROCESS_T0, 3)}
+scheduler = None
 last_run = None
 last_run_status = "never"
-is_running = False
+# profilers requested via POST /profile for the next job, and that run's summary
+pending_profile = None
+last_profile = None
+_profile_lock = threading.Lock()
+# user code -> fingerprint of (memberships, interests) at the last successful run
+user_fingerprints = {}
 
 
-def initialize_engine():
-    """Initialize the recommendation engine."""
+def initialize_engine(warmup=False):
+    """Initialize the recommendation engine (idempotent, thread-safe)."""
     global engine
-    print(f"[{datetime.now().isoformat()}] Initializing recommendation engine...")
-    engine = RecommendationEngine(model_path="dqn_recommender.pth")
-    print(f"[{datetime.now().isoformat()}] Engine initialized successfully")
+    with _engine_lock:
+        if engine is not None:
+            return engine
+        print(f"[{datetime.now().isoformat()}] Initializing recommendation engine...")
+        t0 = time.perf_counter()
+        from recommender import RecommendationEngine
+        t1 = time.perf_counter()
+        instance = RecommendationEngine(model_path="dqn_recommender.pth")
+        t2 = time.perf_counter()
+        startup_timings["inference_imports"] = round(t1 - t0, 3)
+        startup_timings["model_load"] = round(t2 - t1, 3)
+        if warmup:
+            startup_timings["warmup"] = round(instance.warmup(), 3)
+        engine = instance
+        print(f"[{datetime.now().isoformat()}] Engine initialized successfully ({startup_timings})")
+        if stream_on_engine_load and interaction_stream is None:
+            start_interaction_stream()
+        return engine
+
+
+def get_engine():
+    """Return the engine, loading it on first use."""
+    return engine if engine is not None else initialize_engine()
+
+
+def load_user_recommendations(user_id):
+    """Read-through loader for the cache: one user's rows from recommendations_metadata.
+
+    Returns [] for a user without recommendations (cached as an empty entry)
+    and None when Supabase is not configured.
+    """
+    store = get_store()
+    if store is None:
+        return None
+
+    rows = store.select(
+        "recommendations_metadata",
+        "entity_type, entity_id, score",
+        filters={"user_id": f"eq.{user_id}"},
+        timeout=CACHE_LOAD_TIMEOUT_SECONDS,
+        max_retries=1,
+    )
+    return rows
+
+
+def _event_group(event_id):
+    """Group of an upcoming event, for attributing event interactions (None if unknown)."""
+    return event_groups.get(event_id)
+
+
+def start_interaction_stream():
+    """Start tailing `interactions` into the engine's per-user state store."""
+    global interaction_stream
+    from interaction_stream import InteractionStream, SupabaseInteractionSource, UserStateStore
+
+    store = get_store()
+    if store is None:
+        print("[WARNING] Supabase credentials not found, interaction stream disabled")
+        return None
+
+    engine = get_engine()
+    state = UserStateStore(engine.env.group_embeddings, seq_len=engine.env.seq_len)
+    engine.interaction_state = state
+    interaction_stream = InteractionStream(
+        SupabaseInteractionSource(store),
+        state,
+        engine.users,
+        poll_interval=STREAM_POLL_SECONDS,
+        comembership=engine.comembership,
+        event_group_lookup=_event_group,
+    )
+    interaction_stream.start()
+    return interaction_stream
+
+
+reco_cache = RecommendationCache(
+    max_users=CACHE_MAX_USERS,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    loader=load_user_recommendations,
+)
 
 
 def fetch_data_from_supabase():
-    """Fetch users, groups, memberships, and events from Supabase."""
-    supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    
-    if not supabase_url or not supabase_key:
+    """Fetch users, groups and memberships from Supabase (events come from event_index)."""
+    store = get_store()
+    if store is None:
         raise ValueError("Missing Supabase credentials in environment")
-    
-    supabase = create_client(supabase_url, supabase_key)
-    
-    # Fetch all required data
-    users = supabase.table("users").select("id, auth_user_id").execute().data
-    groups = supabase.table("groups").select("id, name, type").execute().data
-    memberships = supabase.table("group_members").select("user_id, group_id").execute().data
-    events = supabase.table("events").select("id, group_id, time, title").execute().data
 
-    return users, groups, memberships, events
+    # Fetch all required data (tables concurrently, each paginated in full)
+    tables = store.select_many({
+        "users": ("users", "id, auth_user_id, visibility", "id"),
+        "groups": ("groups", "id, name, type", "id"),
+        "memberships": ("group_members", "user_id, group_id, created_at", "group_id,user_id"),
+    })
+
+    return tables["users"], tables["groups"], tables["memberships"]
 
 
-def run_recommendation_job():
-    """Run the recommendation generation job."""
-    global last_run, last_run_status, is_running
-    
-    if is_running:
-        print(f"[{datetime.now().isoformat()}] Job already running, skipping...")
-        return
-    
-    is_running = True
+def _user_fingerprint(group_ids, interests):
+    """Stable digest of the inputs that determine a user's recommendations."""
+    payload = "|".join(sorted(str(g) for g in group_ids)) + "#" + "|".join(sorted(interests))
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def _compute_fingerprints(data):
+    """user code -> fingerprint for every user in a JobData."""
+    return {
+        code: _user_fingerprint(data.groups_of(code).tolist(), data.interests.get(code, []))
+        for code in data.user_codes.tolist()
+    }
+
+
+def run_recommendation_job(kind="full", token=None):
+    """Run the recommendation generation job.
+
+    kind="full" recomputes every user. kind="incremental" only recomputes
+    users whose memberships or interests changed since their last run.
+    `token` is the scheduler's CancelToken and is checked between phases.
+    If profiling was requested via /profile, this run is profiled.
+    """
+    global last_run, last_run_status, pending_profile, last_profile, event_groups
+
+    with _profile_lock:
+        requested, pending_profile = pending_profile, None
+    profile = ProfileSession(f"job-{kind}", requested["profilers"]) if requested is not None else None
+
+    def checkpoint(phase):
+        if profile is not None:
+            profile.mark(phase)
+        if token is not None:
+            token.raise_if_cancelled()
+
     start_time = datetime.now()
-    
+
     try:
         print(f"\n{'='*60}")
-        print(f"[{start_time.isoformat()}] Starting recommendation generation job")
+        print(f"[{start_time.isoformat()}] Starting {kind} recommendation generation job")
         print(f"{'='*60}\n")
-        
-        # Fetch data from Supabase
-        users, groups, memberships, events = fetch_data_from_supabase()
-        
+
+        engine = get_engine()
+        # Started after the engine loads: importing torch under tracemalloc takes minutes
+        if profile is not None:
+            profile.start()
+
+        # Fetch data from Supabase and convert it to columns straight away;
+        # the row dicts are dropped once JobData is built
+        users, groups, memberships = fetch_data_from_supabase()
+        data = JobData.from_rows(users, groups, memberships,
+                                 engine.fetch_user_interests(), interner=engine.users)
+        del users, groups, memberships
+        event_index.refresh(get_store(), full=(kind == "full"))
+        # Rebuilt (not updated) so events pruned from the index are dropped too
+        event_groups = dict(zip(event_index.ids.tolist(), event_index.group_ids.tolist()))
+        checkpoint("fetch")
+
+        fingerprints = _compute_fingerprints(data)
+        user_codes = data.user_codes
+        if kind == "incremental":
+            user_codes = [c for c in user_codes.tolist() if user_fingerprints.get(c) != fingerprints[c]]
+            if not user_codes:
+                print(f"[{datetime.now().isoformat()}] No changed users, nothing to recompute")
+                last_run = datetime.now().isoformat()
+                last_run_status = "success (no changes)"
+                return
+
         # Generate group recommendations
         recommendations = engine.generate_recommendations(
-            user_data=users,
-            groups_data=groups,
-            memberships_data=memberships,
-            top_k=8
+            data,
+            top_k=8,
+            user_codes=user_codes,
+            cancel_token=token,
         )
-        
+        checkpoint("score")
+
         # Synthesize event recommendations from group recs + upcoming events
-        event_recommendations = synthesize_event_recommendations(recommendations, events)
-        combined = recommendations + event_recommendations
+        event_recommendations = synthesize_event_recommendations(recommendations, event_index)
+        combined = recommendations.concat(event_recommendations)
+        checkpoint("events")
+
+        # People suggestions for the same users, against every user in this run
+        if PEOPLE_MATCHING:
+            combined = combined.concat(engine.people.recommend(data, user_codes=user_codes, cancel_token=token))
+            checkpoint("people")
 
         # Push to Supabase
         engine.push_to_supabase(combined)
-        
+        reco_cache.put_batch(combined)
+        for code in list(user_codes):
+            user_fingerprints[code] = fingerprints[code]
+
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
-        
+
         last_run = end_time.isoformat()
-        last_run_status = f"success (took {duration:.2f}s)"
-        
+        last_run_status = f"success ({kind}, {len(user_codes)} users, took {duration:.2f}s)"
+
         print(f"\n{'='*60}")
         print(f"[{end_time.isoformat()}] Job completed successfully in {duration:.2f}s")
         print(f"{'='*60}\n")
-        
+
     except Exception as e:
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
         last_run = end_time.isoformat()
-        last_run_status = f"failed: {str(e)}"
-        
+        outcome = "cancelled" if isinstance(e, JobCancelled) else "failed"
+        last_run_status = f"{outcome}: {str(e)}"
+
         print(f"\n{'='*60}")
-        print(f"[{end_time.isoformat()}] Job failed after {duration:.2f}s")
+        print(f"[{end_time.isoformat()}] Job {outcome} after {duration:.2f}s")
         print(f"Error: {e}")
         print(f"{'='*60}\n")
-    
+        raise
+
     finally:
-        is_running = False
+        if profile is not None and profile.active:
+            last_profile = profile.stop()
 
 
 def synthesize_event_recommendations(group_recs, events):
     """Create event recommendations from group recommendations and upcoming events using a simple heuristic.
 
-    For each user, take top group recs and recommend upcoming events from those groups.
+    For each user, take the top 5 ranked group recs and recommend upcoming events from those groups.
     Score = group_score * time_decay, where time_decay favors sooner events.
+
+    Args:
+        group_recs: RecommendationBatch of group recommendations (contiguous per user)
+        events: EventIndex of upcoming events, sorted per group with decay factors
+
+    Returns:
+        RecommendationBatch of event recommendations, ranked per user
     """
-    from collections import defaultdict
-    from datetime import timezone
-    import math
-
-    # Group group-recs by user
-    by_user = defaultdict(list)
-    for r in group_recs or []:
-        if r.get("entity_type") == "group":
-            by_user[r["user_id"]].append(r)
-
-    # Group events by group_id
-    events_by_group = defaultdict(list)
-    for e in events or []:
-        events_by_group[e.get("group_id")].append(e)
-
-    now = datetime.now(timezone.utc)
-    out = []
-
-    for user_id, recs in by_user.items():
-        # Consider top 5 groups per user
-        top_groups = sorted(recs, key=lambda x: x.get("score", 0), reverse=True)[:5]
-        for gr in top_groups:
-            group_id = gr.get("entity_id")
-            try:
-                gid = int(group_id)
-            except Exception:
+    group_recs = group_recs.of_type("group")
+    ev_ids, ev_decay = events.ids, events.decay
+
+    # Lay each user's group recs out as one padded row and take the first 5 by
+    # rank (not raw score, so a diversity re-ranking is preserved)
+    codes = group_recs.user_codes
+    if not len(codes):
+        return RecommendationBatch.empty(group_recs.interner)
+    row_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    row_lengths = np.diff(np.r_[row_starts, len(codes)])
+    row_of = np.repeat(np.arange(len(row_starts)), row_lengths)
+    col_of = np.arange(len(codes)) - row_starts[row_of]
+    padded = np.full((len(row_starts), row_lengths.max()), -np.inf, dtype=np.float32)
+    padded[row_of, col_of] = -group_recs.ranks.astype(np.float32)
+    top_cols, _, counts = topk_with_exclusions(padded, 5, inplace=True)
+
+    user_parts, id_parts, score_parts = [], [], []
+    for row, (row_start, n) in enumerate(zip(row_starts.tolist(), counts.tolist())):
+        for j in (row_start + top_cols[row, :n]).tolist():
+            span = events.span(int(group_recs.entity_ids[j]))
+            if span is None:
                 continue
-            for ev in events_by_group.get(gid, []):
-                ev_time = ev.get("time")
-                if not ev_time:
-                    continue
-                try:
-                    ev_dt = datetime.fromisoformat(str(ev_time).replace("Z", "+00:00"))
-                except Exception:
-                    continue
-                if ev_dt < now:
-                    continue
-                days = (ev_dt - now).total_seconds() / 86400.0
-                time_decay = math.exp(-days / 30.0)
-                score = float(gr.get("score", 0.0)) * float(time_decay)
-                out.append({
-                    "user_id": gr["user_id"],
-                    "entity_type": "event",
-                    "entity_id": ev.get("id"),
-                    "score": score,
-                })
-
-    # Deduplicate by (user, event) keeping max score
-    best = {}
-    for r in out:
-        key = (r["user_id"], r["entity_id"]) 
-        if key not in best or r["score"] > best[key]["score"]:
-            best[key] = r
-    return list(best.values())
-
-
-def scheduler_loop():
-    """Background thread that runs recommendations every hour."""
-    print(f"[{datetime.now().isoformat()}] Scheduler started (runs every 3600 seconds)")
-    
-    # Run immediately on startup
-    run_recommendation_job()
-    
-    # Then run every hour
-    while True:
-        time.sleep(3600)  # 1 hour
-        run_recommendation_job()
+            start, end = span
+            user_parts.append(np.full(end - start, codes[j], dtype=np.int32))
+            id_parts.append(ev_ids[start:end])
+            score_parts.append(group_recs.scores[j] * ev_decay[start:end])
+
+    if not user_parts:
+        return RecommendationBatch.empty(group_recs.interner)
+    users = np.concatenate(user_parts)
+    event_ids = np.concatenate(id_parts)
+    scores = np.concatenate(score_parts).astype(np.float32)
+
+    # Deduplicate by (user, event) keeping max score, then rank within user
+    order = np.lexsort((-scores, event_ids, users))
+    users, event_ids, scores = users[order], event_ids[order], scores[order]
+    first = np.ones(len(users), dtype=bool)
+    first[1:] = (users[1:] != users[:-1]) | (event_ids[1:] != event_ids[:-1])
+    users, event_ids, scores = users[first], event_ids[first], scores[first]
+    order = np.lexsort((-scores, users))
+    users, event_ids, scores = users[order], event_ids[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    ranks = np.arange(len(users)) - np.repeat(starts, np.diff(np.r_[starts, len(users)])) + 1
+
+    return RecommendationBatch(
+        group_recs.interner,
+        users,
+        np.full(len(users), ENTITY_CODES["event"], dtype=np.int8),
+        event_ids,
+        scores,
+        ranks.astype(np.int16),
+    )
+
+
+def build_scheduler():
+    """Create the job scheduler with full and incremental schedules."""
+    return JobScheduler(
+        job_fn=run_recommendation_job,
+        schedules=[
+            Schedule("full", FULL_INTERVAL_SECONDS, SCHEDULE_JITTER_SECONDS, timeout_seconds=JOB_TIMEOUT_SECONDS),
+            Schedule("incremental", INCREMENTAL_INTERVAL_SECONDS, SCHEDULE_JITTER_SECONDS,
+                     offset_seconds=INCREMENTAL_OFFSET_SECONDS, timeout_seconds=JOB_TIMEOUT_SECONDS),
+        ],
+        # Run a full recompute immediately on startup
+        run_on_start="full",
+    )
+
+
+def _is_running():
+    return scheduler is not None and scheduler.is_running
 
 
 @app.route("/health", methods=["GET"])
@@ -201,28 +415,162 @@ def health():
         "model_loaded": engine is not None,
         "last_run": last_run,
         "last_run_status": last_run_status,
-        "is_running": is_running,
+        "is_running": _is_running(),
         "timestamp": datetime.now().isoformat()
     })
 
 
 @app.route("/trigger", methods=["POST"])
 def trigger_job():
-    """Manually trigger recommendation generation."""
-    if is_running:
-        return jsonify({
-            "status": "already_running",
-            "message": "Recommendation job is already in progress"
-        }), 409
-    
-    # Run in background thread
-    thread = threading.Thread(target=run_recommendation_job)
-    thread.daemon = True
-    thread.start()
-    
+    """Manually trigger recommendation generation.
+
+    Optional `mode` (query string or JSON body): "full" (default) or
+    "incremental". Duplicate triggers are coalesced into one pending run.
+    """
+    body = request.get_json(silent=True) or {}
+    mode = request.args.get("mode") or body.get("mode") or "full"
+    if scheduler is None:
+        return jsonify({"status": "unavailable", "message": "Scheduler not started"}), 503
+    try:
+        result = scheduler.trigger(mode)
+    except ValueError as e:
+        return jsonify({"status": "invalid", "message": str(e)}), 400
+
+    return jsonify({
+        "status": result,
+        "mode": mode,
+        "message": "Recommendation generation queued" if result == "queued"
+                   else "An identical run is already pending",
+        "is_running": scheduler.is_running,
+        "timestamp": datetime.now().isoformat()
+    }), 202
+
+
+@app.route("/cancel", methods=["POST"])
+def cancel_job():
+    """Cooperatively cancel the running recommendation job."""
+    cancelled = scheduler is not None and scheduler.cancel()
     return jsonify({
-        "status": "triggered",
-        "message": "Recommendation generation started",
+        "status": "cancelling" if cancelled else "idle",
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.route("/profile", methods=["GET", "POST"])
+def profile_next_job():
+    """Profile the next recommendation job.
+
+    POST arms profiling for the next run. Optional `profilers` (query string
+    or JSON body, comma-separated or list): any of cprofile, torch,
+    tracemalloc (default all). Optional `trigger=true` also queues a run of
+    `mode` (default "full"). GET shows the pending request and the last
+    profile's summary (output directory and files).
+    """
+    global pending_profile
+    if request.method == "GET":
+        return jsonify({"pending": pending_profile, "last": last_profile})
+
+    body = request.get_json(silent=True) or {}
+    try:
+        profilers = parse_profilers(request.args.get("profilers") or body.get("profilers"))
+    except ValueError as e:
+        return jsonify({"status": "invalid", "message": str(e)}), 400
+    with _profile_lock:
+        pending_profile = {"profilers": list(profilers), "requested_at": datetime.now().isoformat()}
+
+    trigger = str(request.args.get("trigger") or body.get("trigger") or "").lower() in ("1", "true", "yes")
+    triggered = None
+    if trigger:
+        mode = request.args.get("mode") or body.get("mode") or "full"
+        if scheduler is None:
+            return jsonify({"status": "unavailable", "message": "Scheduler not started"}), 503
+        try:
+            triggered = scheduler.trigger(mode)
+        except ValueError as e:
+            return jsonify({"status": "invalid", "message": str(e)}), 400
+
+    return jsonify({
+        "status": "armed",
+        "profilers": list(profilers),
+        "triggered": triggered,
+        "message": "The next recommendation job will be profiled",
+        "timestamp": datetime.now().isoformat()
+    }), 202
+
+
+@app.route("/recommendations/<user_id>", methods=["GET"])
+def get_user_recommendations(user_id):
+    """Serve a user's cached recommendations.
+
+    Query params: `type` ("group" default, or "event") and `limit` (default 20).
+    Responds 304 when the client's If-None-Match matches the current ETag.
+    """
+    entity_type = request.args.get("type", "group")
+    if entity_type not in ENTITY_TYPES:
+        return jsonify({"error": f"Unsupported type: {entity_type}"}), 400
+    try:
+        limit = max(1, int(request.args.get("limit", 20)))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        entry = reco_cache.get(user_id)
+    except Exception as e:
+        return jsonify({"error": f"Cache load failed: {e}"}), 503
+    if entry is None:
+        return jsonify({"error": "No recommendations for user"}), 404
+
+    etag = f'{entry.etag[:-1]}-{entity_type}-{limit}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    if etag in request.headers.get("If-None-Match", ""):
+        return "", 304, headers
+
+    return jsonify({
+        "user_id": user_id,
+        "entity_type": entity_type,
+        "data": entry.to_rows(entity_type, limit),
+        "generated_at": datetime.fromtimestamp(entry.created_at).isoformat()
+    }), 200, headers
+
+
+@app.route("/invalidate", methods=["POST"])
+@app.route("/invalidate/<user_id>", methods=["POST"])
+def invalidate_user_recommendations(user_id=None):
+    """Drop cached recommendations for users whose inputs changed.
+
+    Called by the app when a user joins/leaves a group or edits interests.
+    Accepts a path user id or a JSON body {"user_ids": [...]}, and queues a
+    (coalesced) incremental run so fresh results replace the evicted ones.
+    """
+    body = request.get_json(silent=True) or {}
+    user_ids = [user_id] if user_id else list(body.get("user_ids") or [])
+    if not user_ids:
+        return jsonify({"error": "No user ids given"}), 400
+
+    removed = reco_cache.invalidate(user_ids)
+    run = scheduler.trigger("incremental", source="invalidate") if scheduler is not None else None
+    return jsonify({
+        "status": "invalidated",
+        "removed": removed,
+        "recompute": run,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.route("/score/<user_id>", methods=["GET"])
+def score_user_online(user_id):
+    """Score a user now from in-memory state (latest interactions, live memberships)."""
+    try:
+        top_k = max(1, int(request.args.get("limit", 8)))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    ranked = get_engine().score_user(user_id, top_k=top_k)
+    return jsonify({
+        "user_id": user_id,
+        "data": [
+            {"entity_type": "group", "entity_id": str(gid), "score": score, "rank": rank}
+            for rank, (gid, score) in enumerate(ranked, 1)
+        ],
         "timestamp": datetime.now().isoformat()
     })
 
@@ -230,18 +578,27 @@ def trigger_job():
 @app.route("/status", methods=["GET"])
 def status():
     """Get detailed service status."""
+    store = get_store()
     return jsonify({
         "service": "ml-recommendation-service",
         "model": {
             "loaded": engine is not None,
-            "path": "dqn_recommender.pth"
+            "path": "dqn_recommender.pth",
+            "experiment": engine.experiment.info() if engine is not None and engine.experiment is not None else None,
         },
+        "experiment": engine.last_experiment if engine is not None else None,
+        "startup": startup_timings,
         "scheduler": {
-            "interval_seconds": 3600,
             "last_run": last_run,
             "last_run_status": last_run_status,
-            "is_running": is_running
+            "is_running": _is_running(),
+            **(scheduler.status() if scheduler is not None else {})
         },
+        "cache": reco_cache.info(),
+        "interaction_stream": interaction_stream.stats if interaction_stream is not None else None,
+        "event_index": event_index.stats(),
+        "profiling": {"pending": pending_profile is not None, "last": last_profile},
+        "supabase": store.stats() if store is not None else None,
         "environment": {
             "supabase_url": os.getenv("NEXT_PUBLIC_SUPABASE_URL") is not None,
             "service_key": os.getenv("SUPABASE_SERVICE_ROLE_KEY") is not None
@@ -251,6 +608,14 @@ def status():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ML recommendation service")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--warmup", action="store_true",
+                      help="load the model and run a dummy batch before serving")
+    mode.add_argument("--lazy", action="store_true",
+                      help="defer model loading until the first job")
+    args = parser.parse_args()
+
     print("""
     ╔════════════════════════════════════════════════════════════╗
     ║     ML RECOMMENDATION SERVICE                              ║
@@ -259,12 +624,18 @@ if __name__ == "__main__":
     """)
     
     # Initialize engine
-    initialize_engine()
+    if not args.lazy:
+        initialize_engine(warmup=args.warmup)
     
-    # Start scheduler in background thread
-    scheduler_thread = threading.Thread(target=scheduler_loop)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
+    if STREAM_INTERACTIONS and args.lazy:
+        stream_on_engine_load = True
+        print(f"[{datetime.now().isoformat()}] Interaction stream will start once the engine loads")
+    elif STREAM_INTERACTIONS:
+        start_interaction_stream()
+
+    # Start scheduler (runs a full job immediately, then on schedule)
+    scheduler = build_scheduler()
+    scheduler.start()
     
     # Start Flask server
     port = int(os.getenv("ML_SERVICE_PORT", 5000))
@@ -272,7 +643,13 @@ if __name__ == "__main__":
     print(f"[{datetime.now().isoformat()}] API endpoints:")
     print(f"  - GET  http://localhost:{port}/health")
     print(f"  - GET  http://localhost:{port}/status")
-    print(f"  - POST http://localhost:{port}/trigger")
+    print(f"  - POST http://localhost:{port}/trigger?mode=full|incremental")
+    print(f"  - POST http://localhost:{port}/cancel")
+    print(f"  - POST http://localhost:{port}/profile?profilers=cprofile,torch,tracemalloc&trigger=true")
+    print(f"  - GET  http://localhost:{port}/recommendations/<user_id>?type=group|event")
+    print(f"  - POST http://localhost:{port}/invalidate[/<user_id>]")
+    print(f"  - GET  http://localhost:{port}/score/<user_id>")
     print()
-    
+
+    startup_timings["ready"] = round(time.perf_counter() - _PROCESS_T0, 3)
     app.run(host="0.0.0.0", port=port, debug=False)
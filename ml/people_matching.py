@@ -0,0 +1,217 @@
+"""
+User-to-user ("people you may know") matching for the batch job.
+
+Score for a (query user, candidate user) pair:
+
+    interest_weight * cosine(interest embeddings)
+    + comembership_weight * cm / (1 + cm)
+
+The interest embedding is the normalized mean of embed_hobbies([interest])
+over the user's interests. cm is the Adamic-Adar sum over shared groups,
+sum of 1 / log(group size). Groups larger than max_group_size are
+skipped: they say little about two people and would make the pair count
+quadratic.
+
+Private users (users.visibility = 'private') still get suggestions but are
+never suggested to anyone: the job writes with the service role, which
+bypasses the RLS policy that hides them.
+
+Candidates are scored in (row block x column block) tiles: a dense
+matmul for interests plus a sparse add of co-membership pairs. Only the
+tile cells that beat a row's current k-th best are gathered and merged
+into the running per-row top-k with the shared topk_with_exclusions
+kernel, so the U x U matrix never exists. Memory is bounded by one tile
+plus the (U, D) embedding table.
+"""
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from columnar import RecommendationBatch
+from dataset_state_mapper import embed_hobbies
+from topk import csr_take_rows, topk_with_exclusions
+
+PEOPLE_TOP_K = int(os.getenv("ML_PEOPLE_TOP_K", 8))
+PEOPLE_EMBED_DIM = int(os.getenv("ML_PEOPLE_EMBED_DIM", 32))
+PEOPLE_INTEREST_WEIGHT = float(os.getenv("ML_PEOPLE_INTEREST_WEIGHT", 0.6))
+PEOPLE_COMEMBERSHIP_WEIGHT = float(os.getenv("ML_PEOPLE_COMEMBERSHIP_WEIGHT", 0.4))
+PEOPLE_ROW_BLOCK = int(os.getenv("ML_PEOPLE_ROW_BLOCK", 1024))
+PEOPLE_COL_BLOCK = int(os.getenv("ML_PEOPLE_COL_BLOCK", 4096))
+PEOPLE_MAX_GROUP_SIZE = int(os.getenv("ML_PEOPLE_MAX_GROUP_SIZE", 2000))
+
+
+class PeopleMatcher:
+    """Blocked user-to-user top-k over interest embeddings and shared groups."""
+
+    def __init__(self, embed_dim=PEOPLE_EMBED_DIM, interest_weight=PEOPLE_INTEREST_WEIGHT,
+                 comembership_weight=PEOPLE_COMEMBERSHIP_WEIGHT, row_block=PEOPLE_ROW_BLOCK,
+                 col_block=PEOPLE_COL_BLOCK, max_group_size=PEOPLE_MAX_GROUP_SIZE):
+        self.embed_dim = embed_dim
+        self.interest_weight = interest_weight
+        self.comembership_weight = comembership_weight
+        self.row_block = row_block
+        self.col_block = col_block
+        self.max_group_size = max_group_size
+        # interest name -> unit vector, kept across runs
+        self._interest_vectors = {}
+
+    # -----------------------------
+    # Inputs
+    # -----------------------------
+    def _interest_vector(self, name):
+        vec = self._interest_vectors.get(name)
+        if vec is None:
+            vec = embed_hobbies([name], self.embed_dim)
+            vec = vec / max(np.linalg.norm(vec), 1e-8)
+            self._interest_vectors[name] = vec
+        return vec
+
+    def interest_embeddings(self, data):
+        """(U, D) unit interest embeddings by user position; zero rows for users without interests."""
+        emb = np.zeros((len(data.user_codes), self.embed_dim), dtype=np.float32)
+        pos_of = _positions(data)
+        vocab, user_pos, name_ids = {}, [], []
+        for code, names in data.interests.items():
+            pos = pos_of[code] if code < len(pos_of) else -1
+            if pos < 0:
+                continue
+            for name in set(names):
+                user_pos.append(pos)
+                name_ids.append(vocab.setdefault(name, len(vocab)))
+        if not vocab:
+            return emb
+        table = np.stack([self._interest_vector(name) for name in vocab])
+        np.add.at(emb, np.asarray(user_pos), table[np.asarray(name_ids)])
+        emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-8)
+        return emb
+
+    def group_graph(self, data):
+        """CSR user position -> group slot, CSR group slot -> member positions, and per-slot weights."""
+        pos_of = _positions(data)
+        users = pos_of[data.member_user_codes]
+        groups = data.member_groups
+        known = users >= 0
+        users, groups = users[known], groups[known]
+
+        keys, slot_of, sizes = np.unique(groups, return_inverse=True, return_counts=True)
+        useful = (sizes >= 2) & (sizes <= self.max_group_size)
+        keep = useful[slot_of]
+        users, slots = users[keep], slot_of[keep]
+        weights = np.where(useful, 1.0 / np.log(np.maximum(sizes, 2)), 0.0).astype(np.float32)
+
+        num_users = len(data.user_codes)
+        by_user = np.lexsort((slots, users))
+        user_indptr = np.zeros(num_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(users, minlength=num_users), out=user_indptr[1:])
+        by_group = np.lexsort((users, slots))
+        group_indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(slots, minlength=len(keys)), out=group_indptr[1:])
+        return (user_indptr, slots[by_user]), (group_indptr, users[by_group]), weights
+
+    # -----------------------------
+    # Scoring
+    # -----------------------------
+    def recommend(self, data, top_k=PEOPLE_TOP_K, user_codes=None, cancel_token=None):
+        """Top-k people for each user in `user_codes` (default: everyone), among the
+        non-private users in `data`.
+
+        Returns a RecommendationBatch with entity_type "user"; entity ids are
+        interner codes, decoded to user ids by RecommendationBatch.to_rows.
+        """
+        start = time.perf_counter()
+        codes = data.user_codes.astype(np.int64)
+        num_users = len(codes)
+        pos_of = _positions(data)
+        if user_codes is None:
+            query_pos = np.arange(num_users)
+        else:
+            query_pos = pos_of[np.asarray(user_codes, dtype=np.int64)]
+            query_pos = query_pos[query_pos >= 0]
+        hidden = data.user_private
+        k = min(top_k, max(num_users - 1, 0), int((~hidden).sum()))
+        batch = RecommendationBatch.allocate(data.interner, len(query_pos) * k,
+                                             meta={"people": {"model": "interests+comembership"}})
+        if k == 0 or not len(query_pos):
+            return batch
+
+        emb = self.interest_embeddings(data)
+        (user_indptr, user_slots), (group_indptr, group_members), slot_weights = self.group_graph(data)
+        cb = min(self.col_block, num_users)
+        tile = np.empty((self.row_block, cb), dtype=np.float32)
+
+        for r0 in range(0, len(query_pos), self.row_block):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            rows = query_pos[r0:r0 + self.row_block]
+            b = len(rows)
+            pair_rows, pair_cols, pair_w = _comembership_pairs(
+                rows, user_indptr, user_slots, group_indptr, group_members, slot_weights
+            )
+            col_order = np.argsort(pair_cols, kind="stable")
+            pair_rows, pair_cols, pair_w = pair_rows[col_order], pair_cols[col_order], pair_w[col_order]
+
+            best_idx = np.full((b, k), -1, dtype=np.int64)
+            best_scores = np.full((b, k), -np.inf, dtype=np.float32)
+            row_emb = emb[rows]
+            for c0 in range(0, num_users, cb):
+                c1 = min(c0 + cb, num_users)
+                width = c1 - c0
+                scores = tile[:b, :width]
+                np.matmul(row_emb, emb[c0:c1].T, out=scores)
+                scores *= self.interest_weight
+
+                lo, hi = np.searchsorted(pair_cols, (c0, c1))
+                if hi > lo:
+                    # Sum shared-group weights per (row, candidate), touching only those cells
+                    cells, inverse = np.unique(pair_rows[lo:hi] * width + (pair_cols[lo:hi] - c0),
+                                               return_inverse=True)
+                    cm = np.bincount(inverse, weights=pair_w[lo:hi]).astype(np.float32)
+                    scores[cells // width, cells % width] += self.comembership_weight * cm / (1.0 + cm)
+
+                own = (rows >= c0) & (rows < c1)
+                scores[np.flatnonzero(own), rows[own] - c0] = -np.inf
+                scores[:, hidden[c0:c1]] = -np.inf
+
+                # Only cells that beat the row's current k-th best (and carry some
+                # signal, score > 0) can enter its top-k; most tiles have few
+                hit_rows, hit_cols = np.nonzero(scores > np.maximum(best_scores[:, -1], 0.0)[:, None])
+                if not len(hit_rows):
+                    continue
+                per_row = np.bincount(hit_rows, minlength=b)
+                slot = np.arange(len(hit_rows)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+                cand_scores = np.full((b, k + per_row.max()), -np.inf, dtype=np.float32)
+                cand_idx = np.full(cand_scores.shape, -1, dtype=np.int64)
+                cand_scores[:, :k], cand_idx[:, :k] = best_scores, best_idx
+                cand_scores[hit_rows, k + slot] = scores[hit_rows, hit_cols]
+                cand_idx[hit_rows, k + slot] = hit_cols + c0
+                pick, best_scores, _ = topk_with_exclusions(cand_scores, k, inplace=True)
+                best_idx = np.take_along_axis(cand_idx, np.maximum(pick, 0), axis=1)
+
+            counts = np.isfinite(best_scores).sum(axis=1)
+            batch.append_topk(codes[rows], "user", codes[np.maximum(best_idx, 0)], best_scores, counts)
+
+        print(f"[{datetime.now().isoformat()}] People matching: {len(query_pos)} users x {num_users} "
+              f"candidates in {time.perf_counter() - start:.2f}s")
+        return batch.trim()
+
+
+def _positions(data):
+    """user code -> position in data.user_codes (-1 for codes not in this run)."""
+    pos_of = np.full(len(data.interner), -1, dtype=np.int64)
+    pos_of[data.user_codes] = np.arange(len(data.user_codes))
+    return pos_of
+
+
+def _comembership_pairs(rows, user_indptr, user_slots, group_indptr, group_members, slot_weights):
+    """(local row, candidate position, weight) for every shared-group pair of a row block."""
+    sub_indptr, slots = csr_take_rows(user_indptr, user_slots, rows)
+    member_indptr, members = csr_take_rows(group_indptr, group_members, slots)
+    per_slot = np.diff(member_indptr)
+    slot_rows = np.repeat(np.arange(len(rows)), np.diff(sub_indptr))
+    return (
+        np.repeat(slot_rows, per_slot),
+        members,
+        np.repeat(slot_weights[slots], per_slot),
+    )
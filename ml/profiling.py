@@ -0,0 +1,219 @@
+"""
+Opt-in profiling for the recommendation job and the training loop.
+
+A ProfileSession runs any of these profilers and writes the results to
+its own run-scoped directory, <ML_PROFILE_DIR>/<name>-<timestamp>/:
+- "cprofile": cprofile.prof (load with pstats/snakeviz) and cprofile.txt
+  (top functions by cumulative time)
+- "torch": torch_trace.json (chrome://tracing / Perfetto) and torch_ops.txt
+  (op table); QNetwork forward/backward passes are labelled via label()
+  ("dqn.forward", "dqn.backward", "dqn.inference")
+- "tracemalloc": tracemalloc.txt (peak usage and top allocation sites)
+  and tracemalloc.snap (load with tracemalloc.Snapshot.load). The kept
+  snapshot is the one taken at the highest traced memory among the
+  mark()/step() calls and the end of the run, so it shows what was live
+  near the peak rather than only what survived the run
+plus summary.json with wall time and the list of files.
+
+When profiling is off, callers skip the session entirely and label() is a
+shared no-op context (record_function alone costs ~12us per call), so the
+only cost is a flag check. torch is imported only if "torch" is requested.
+"""
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+
+PROFILERS = ("cprofile", "torch", "tracemalloc")
+PROFILE_DIR = os.getenv("ML_PROFILE_DIR", "profiles")
+PROFILE_TOP_N = int(os.getenv("ML_PROFILE_TOP_N", 40))
+TRACEMALLOC_FRAMES = int(os.getenv("ML_PROFILE_TRACEMALLOC_FRAMES", 10))
+
+_NO_LABEL = contextlib.nullcontext()
+_torch_profiling = False
+
+
+def label(name):
+    """torch record_function(name) while a torch profile is running, else a no-op context."""
+    if not _torch_profiling:
+        return _NO_LABEL
+    from torch.profiler import record_function
+    return record_function(name)
+
+
+def parse_profilers(value):
+    """'cprofile,torch' / list / None (= all) -> validated tuple of profiler names."""
+    if value is None or value == "all":
+        return PROFILERS
+    names = [v.strip() for v in value.split(",")] if isinstance(value, str) else list(value)
+    unknown = [n for n in names if n not in PROFILERS]
+    if unknown or not names:
+        raise ValueError(f"Unknown profilers {unknown}; choose from {', '.join(PROFILERS)}")
+    return tuple(dict.fromkeys(names))
+
+
+def _set_torch_profiling(on):
+    global _torch_profiling
+    _torch_profiling = on
+
+
+class ProfileSession:
+    """Runs the selected profilers between start() and stop() (or as a context manager).
+
+    With `torch_steps`, the torch profiler records only that many steps
+    (after one wait and one warmup step), advanced by calling step(); this
+    keeps traces of long training runs small. Without it, everything
+    between start() and stop() is recorded.
+    """
+
+    def __init__(self, name, profilers=PROFILERS, directory=PROFILE_DIR, torch_steps=None, top_n=PROFILE_TOP_N):
+        self.profilers = parse_profilers(profilers)
+        self.run_dir = os.path.join(directory, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        self.torch_steps = torch_steps
+        self.top_n = top_n
+        self.summary = None
+        self._cprofile = None
+        self._torch = None
+        self._started_tracemalloc = False
+        self._snapshot = None
+        self._snapshot_label = None
+        self._snapshot_bytes = 0
+        self._t0 = None
+
+    def start(self):
+        os.makedirs(self.run_dir, exist_ok=True)
+        if "torch" in self.profilers:
+            import torch
+            from torch.profiler import ProfilerActivity, profile, schedule
+
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            self._torch = profile(
+                activities=activities,
+                schedule=schedule(wait=1, warmup=1, active=self.torch_steps, repeat=1) if self.torch_steps else None,
+                record_shapes=True,
+                profile_memory=True,
+            )
+            self._torch.__enter__()
+            _set_torch_profiling(True)
+        # After torch: its profiler's first import is very slow under tracemalloc
+        if "tracemalloc" in self.profilers and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        if "cprofile" in self.profilers:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._t0 = time.perf_counter()
+        print(f"[{datetime.now().isoformat()}] Profiling ({', '.join(self.profilers)}) -> {self.run_dir}")
+        return self
+
+    @property
+    def active(self):
+        return self._t0 is not None and self.summary is None
+
+    def step(self):
+        if self._torch is not None and self.torch_steps:
+            self._torch.step()
+        self.mark()
+
+    def mark(self, label=None):
+        """Snapshot allocations if traced memory grew >10% past the last kept snapshot."""
+        if not self._started_tracemalloc:
+            return
+        current = tracemalloc.get_traced_memory()[0]
+        if self._snapshot is None or current > self._snapshot_bytes * 1.1:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._snapshot_label = label
+            self._snapshot_bytes = current
+
+    def stop(self):
+        wall = time.perf_counter() - self._t0
+        # Stop everything before writing: parsing torch results while
+        # tracemalloc/cProfile are still running takes minutes
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._torch is not None:
+            _set_torch_profiling(False)
+            self._torch.__exit__(None, None, None)
+        peak_bytes = None
+        if self._started_tracemalloc:
+            self.mark("end")
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        files = []
+        if self._cprofile is not None:
+            files += self._write_cprofile()
+        if self._torch is not None:
+            files += self._write_torch()
+        if self._started_tracemalloc:
+            files += self._write_tracemalloc(peak_bytes)
+
+        self.summary = {
+            "run_dir": self.run_dir,
+            "profilers": list(self.profilers),
+            "wall_seconds": round(wall, 3),
+            "tracemalloc_peak_mb": round(peak_bytes / 1e6, 2) if peak_bytes is not None else None,
+            "files": files,
+            "finished_at": datetime.now().isoformat(),
+        }
+        with open(os.path.join(self.run_dir, "summary.json"), "w") as f:
+            json.dump(self.summary, f, indent=2)
+        print(f"[{datetime.now().isoformat()}] Profile written to {self.run_dir}")
+        return self.summary
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    # -----------------------------
+    # Writers
+    # -----------------------------
+    def _write_cprofile(self):
+        self._cprofile.dump_stats(os.path.join(self.run_dir, "cprofile.prof"))
+        out = io.StringIO()
+        pstats.Stats(self._cprofile, stream=out).sort_stats("cumulative").print_stats(self.top_n)
+        with open(os.path.join(self.run_dir, "cprofile.txt"), "w") as f:
+            f.write(out.getvalue())
+        return ["cprofile.prof", "cprofile.txt"]
+
+    def _write_torch(self):
+        if self.torch_steps and self._torch.step_num < 2 + self.torch_steps:
+            # Run ended before the scheduled window closed; nothing was exported
+            with open(os.path.join(self.run_dir, "torch_ops.txt"), "w") as f:
+                f.write(f"Run ended after {self._torch.step_num} steps, before the torch profiler window closed\n")
+            return ["torch_ops.txt"]
+        self._torch.export_chrome_trace(os.path.join(self.run_dir, "torch_trace.json"))
+        with open(os.path.join(self.run_dir, "torch_ops.txt"), "w") as f:
+            f.write(self._torch.key_averages().table(sort_by="self_cpu_time_total", row_limit=self.top_n))
+        return ["torch_trace.json", "torch_ops.txt"]
+
+    def _write_tracemalloc(self, peak_bytes):
+        # Drop the profilers' own bookkeeping
+        snapshot = self._snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "*/torch/autograd/profiler*"),
+            tracemalloc.Filter(False, "*/torch/profiler/*"),
+        ])
+        snapshot.dump(os.path.join(self.run_dir, "tracemalloc.snap"))
+        with open(os.path.join(self.run_dir, "tracemalloc.txt"), "w") as f:
+            f.write(f"peak: {peak_bytes / 1e6:.2f} MB; snapshot at '{self._snapshot_label or 'step'}' "
+                    f"with {self._snapshot_bytes / 1e6:.2f} MB live\n\n")
+            f.write(f"Top {self.top_n} allocation sites:\n")
+            for stat in snapshot.statistics("lineno")[:self.top_n]:
+                f.write(f"{stat}\n")
+            f.write(f"\nTop {self.top_n} allocation tracebacks:\n")
+            for stat in snapshot.statistics("traceback")[:min(self.top_n, 10)]:
+                f.write(f"\n{stat.count} blocks, {stat.size / 1e3:.1f} KB\n")
+                f.write("\n".join(stat.traceback.format()) + "\n")
+        return ["tracemalloc.snap", "tracemalloc.txt"]
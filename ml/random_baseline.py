@@ -1,15 +1,24 @@
+import argparse
 import numpy as np
 from reco_env import SequentialRecEnv
 
 # -----------------------------
 # Random Policy Evaluation
 # -----------------------------
+parser = argparse.ArgumentParser()
+parser.add_argument("--num-groups", type=int, default=50)
+parser.add_argument("--num-users", type=int, default=200)
+parser.add_argument("--scaled", action="store_true",
+                    help="lazy users, pre-normalized items, allocation-free steps")
+args = parser.parse_args()
+
 env = SequentialRecEnv(
-    num_groups=50,
-    num_users=200,
+    num_groups=args.num_groups,
+    num_users=args.num_users,
     embed_dim=8,
     seq_len=5,
-    max_steps=20
+    max_steps=20,
+    scaled=args.scaled,
 )
 
 num_episodes = 300
@@ -0,0 +1,219 @@
+"""
+Per-user recommendation cache for the ML service.
+
+Holds each user's latest ranked group and event lists as compact NumPy
+arrays (int64 ids + float32 scores) instead of row dicts, bounded by an
+LRU capacity and a TTL. Every entry carries an ETag derived from its
+contents so HTTP clients can revalidate with If-None-Match.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from columnar import ENTITY_CODES
+
+ENTITY_TYPES = ("group", "event")
+
+
+class CachedRecommendations:
+    """Ranked recommendations for one user, one pair of arrays per entity type."""
+
+    __slots__ = ("ids", "scores", "etag", "created_at")
+
+    def __init__(self, ids, scores, created_at):
+        self.ids = ids
+        self.scores = scores
+        self.created_at = created_at
+        digest = hashlib.blake2b(digest_size=12)
+        for entity_type in ENTITY_TYPES:
+            digest.update(entity_type.encode())
+            digest.update(ids[entity_type].tobytes())
+            digest.update(scores[entity_type].tobytes())
+        self.etag = f'"{digest.hexdigest()}"'
+
+    @classmethod
+    def from_rows(cls, rows, created_at=None):
+        """Build from recommendation rows ({entity_type, entity_id, score}), sorted by score."""
+        by_type = defaultdict(list)
+        for r in rows:
+            if r["entity_type"] in ENTITY_TYPES:
+                by_type[r["entity_type"]].append((int(r["entity_id"]), float(r["score"])))
+        ids, scores = {}, {}
+        for entity_type in ENTITY_TYPES:
+            pairs = by_type.get(entity_type, [])
+            id_arr = np.fromiter((p[0] for p in pairs), dtype=np.int64, count=len(pairs))
+            score_arr = np.fromiter((p[1] for p in pairs), dtype=np.float32, count=len(pairs))
+            order = np.argsort(-score_arr, kind="stable")
+            ids[entity_type] = id_arr[order]
+            scores[entity_type] = score_arr[order]
+        return cls(ids, scores, created_at if created_at is not None else time.time())
+
+    def nbytes(self):
+        return sum(self.ids[t].nbytes + self.scores[t].nbytes for t in ENTITY_TYPES)
+
+    def to_rows(self, entity_type, limit=None):
+        ids = self.ids[entity_type][:limit]
+        scores = self.scores[entity_type][:limit]
+        return [
+            {"entity_type": entity_type, "entity_id": str(i), "score": float(s), "rank": rank}
+            for rank, (i, s) in enumerate(zip(ids.tolist(), scores.tolist()), 1)
+        ]
+
+
+class RecommendationCache:
+    """Thread-safe LRU + TTL cache of CachedRecommendations keyed by user id.
+
+    `loader(user_id)` is an optional read-through callback returning rows for
+    a user that is not cached (e.g. a recommendations_metadata query); it is
+    only hit on a miss, so steady-state reads never touch Postgres. An empty
+    result is cached too (until TTL or invalidation), so users without
+    recommendations don't hit Postgres on every read. None means the
+    loader could not answer and nothing is cached. The loader runs outside
+    the lock. If the user's entry is written or invalidated while it runs,
+    its (possibly stale) rows are returned but not cached.
+    """
+
+    def __init__(self, max_users=50000, ttl_seconds=7200, loader=None):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+        self._entries = OrderedDict()
+        # user id -> token of the read-through load in flight; any write to
+        # the user drops it so that load's result is not cached
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry.created_at > self.ttl_seconds:
+                del self._entries[user_id]
+                self.stats["expired"] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                self.stats["hits"] += 1
+                return entry
+            self.stats["misses"] += 1
+            if self.loader is None:
+                return None
+            token = self._loading[user_id] = object()
+        try:
+            rows = self.loader(user_id)
+        except Exception:
+            self._end_load(user_id, token)
+            raise
+        entry = CachedRecommendations.from_rows(rows) if rows is not None else None
+        with self._lock:
+            # Not cached if the user was written or invalidated during the load
+            if self._end_load_locked(user_id, token) and entry is not None:
+                self._store_locked(user_id, entry)
+        return entry
+
+    def put(self, user_id, rows, created_at=None):
+        entry = CachedRecommendations.from_rows(rows, created_at)
+        with self._lock:
+            self._store_locked(user_id, entry)
+        return entry
+
+    def put_batch(self, batch, created_at=None):
+        """Replace entries for every user in a RecommendationBatch (job output).
+
+        Entries are built straight from each user's slice of the batch arrays,
+        in rank order, without going through row dicts. A user with no group
+        or event rows gets an empty entry. If the run covers more users than
+        the cache holds, only users already cached (the ones being read) and
+        then others up to capacity are built; the rest would be evicted at once.
+        """
+        batch.trim()
+        created_at = created_at if created_at is not None else time.time()
+        type_codes = np.array([ENTITY_CODES[t] for t in ENTITY_TYPES])
+        keep = np.isin(batch.entity_types, type_codes)
+        order = np.lexsort((batch.ranks[keep], batch.entity_types[keep], batch.user_codes[keep]))
+        users = batch.user_codes[keep][order]
+        types = batch.entity_types[keep][order]
+        ids = batch.entity_ids[keep][order]
+        scores = batch.scores[keep][order]
+
+        codes = np.unique(batch.user_codes)
+        user_ids = [batch.interner.decode(c) for c in codes.tolist()]
+        selected = np.arange(len(codes))
+        if len(codes) > self.max_users:
+            with self._lock:
+                cached = np.fromiter((u in self._entries for u in user_ids), dtype=bool, count=len(user_ids))
+            selected = np.concatenate([np.flatnonzero(cached), np.flatnonzero(~cached)])[:self.max_users]
+
+        starts = np.searchsorted(users, codes[selected], side="left")
+        ends = np.searchsorted(users, codes[selected], side="right")
+        entries = []
+        for i, start, end in zip(selected.tolist(), starts.tolist(), ends.tolist()):
+            bounds = start + np.searchsorted(types[start:end], type_codes, side="left")
+            bounds = np.append(bounds, end)
+            # Copies, so cached entries don't keep the whole run's arrays alive
+            entry_ids = {t: ids[bounds[j]:bounds[j + 1]].copy() for j, t in enumerate(ENTITY_TYPES)}
+            entry_scores = {t: scores[bounds[j]:bounds[j + 1]].copy() for j, t in enumerate(ENTITY_TYPES)}
+            entries.append((user_ids[i], CachedRecommendations(entry_ids, entry_scores, created_at)))
+
+        with self._lock:
+            for user_id in user_ids:
+                self._loading.pop(user_id, None)
+            for user_id, entry in entries:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+            self._evict_locked()
+        return len(entries)
+
+    def invalidate(self, user_ids):
+        removed = 0
+        with self._lock:
+            for user_id in user_ids:
+                self._loading.pop(user_id, None)
+                if self._entries.pop(user_id, None) is not None:
+                    removed += 1
+            self.stats["invalidated"] += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loading.clear()
+
+    def info(self):
+        with self._lock:
+            return {
+                "users": len(self._entries),
+                "max_users": self.max_users,
+                "ttl_seconds": self.ttl_seconds,
+                "bytes": sum(e.nbytes() for e in self._entries.values()),
+                **self.stats,
+            }
+
+    def _end_load(self, user_id, token):
+        with self._lock:
+            self._end_load_locked(user_id, token)
+
+    def _end_load_locked(self, user_id, token):
+        """Drop the load's token; False if a write to the user superseded it."""
+        if self._loading.get(user_id) is not token:
+            return False
+        del self._loading[user_id]
+        return True
+
+    def _store_locked(self, user_id, entry):
+        self._loading.pop(user_id, None)
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        self._evict_locked()
+
+    def _evict_locked(self):
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
@@ -11,6 +11,15 @@ class SequentialRecEnv(gym.Env):
     - State: last seq_len item IDs (integers) and user's embedding (we return combined vector).
     - Action: index of a group to recommend.
     - Reward: +1 if user "joins", +0.5 if "clicks", else 0.
+
+    Scaled mode (scaled=True) is for large catalogs and user counts:
+    - user embeddings are generated lazily from (user_seed, user_id) on reset,
+      so memory does not grow with num_users
+    - item embeddings are pre-normalized once and the user norm is cached,
+      recomputed only when the user's embedding drifts
+    - the step hot path is float32 and writes into preallocated buffers; the
+      returned observation and info dict are reused between steps (copy them
+      if you keep them)
     """
 
     metadata = {"render.modes": ["human"]}
@@ -25,6 +34,8 @@ class SequentialRecEnv(gym.Env):
         click_prob_scale=1.0,
         join_prob_scale=1.0,
         seed: int | None = None,
+        scaled: bool = False,
+        user_seed: int | None = None,
     ):
         super().__init__()
         self.rng = np.random.default_rng(seed)
@@ -34,10 +45,23 @@ class SequentialRecEnv(gym.Env):
         self.seq_len = seq_len
         self.max_steps = max_steps
 
+        self.scaled = scaled
+
         # Latent embeddings
         self.group_embeddings = self.rng.normal(size=(num_groups, embed_dim)).astype(np.float32)
-        # We'll sample a user per episode with its latent preference vector
-        self.user_embeddings = self.rng.normal(size=(num_users, embed_dim)).astype(np.float32)
+        if scaled:
+            # Users are derived from (user_seed, user_id) on demand instead of stored
+            self.user_seed = int(self.rng.integers(2**63)) if user_seed is None else user_seed
+            self.user_embeddings = None
+            norms = np.linalg.norm(self.group_embeddings, axis=1, keepdims=True)
+            self.unit_group_embeddings = (self.group_embeddings / (norms + 1e-8)).astype(np.float32)
+            self._obs = np.zeros(embed_dim + seq_len, dtype=np.float32)
+            self._noise = np.zeros(embed_dim, dtype=np.float32)
+            self._scratch = np.zeros(embed_dim, dtype=np.float32)
+            self._info = {}
+        else:
+            # We'll sample a user per episode with its latent preference vector
+            self.user_embeddings = self.rng.normal(size=(num_users, embed_dim)).astype(np.float32)
 
         # Observation: we will return a continuous vector combining:
         # - one-hot-ish or index list of last seq_len group ids (integers)
@@ -59,6 +83,15 @@ class SequentialRecEnv(gym.Env):
         self.current_user_embed = None
         self.last_seq = None
         self.step_count = 0
+        self._seq_head = 0
+        self._user_norm = 0.0
+
+    def user_embedding(self, user_id):
+        """Latent embedding of a user (lazily derived in scaled mode)."""
+        if self.user_embeddings is not None:
+            return self.user_embeddings[user_id]
+        rng = np.random.default_rng((self.user_seed, user_id))
+        return rng.standard_normal(self.embed_dim, dtype=np.float32)
 
     def reset(self, seed: int | None = None, options=None):
         if seed is not None:
@@ -66,6 +99,13 @@ class SequentialRecEnv(gym.Env):
 
         # sample a user for this episode
         self.current_user_id = int(self.rng.integers(0, self.num_users))
+        if self.scaled:
+            self.current_user_embed = self.user_embedding(self.current_user_id)
+            self._user_norm = float(np.sqrt(np.dot(self.current_user_embed, self.current_user_embed)))
+            self.last_seq = np.zeros(self.seq_len, dtype=np.int32)
+            self._seq_head = 0
+            self.step_count = 0
+            return self._get_obs(), {}
         self.current_user_embed = self.user_embeddings[self.current_user_id].copy()
 
         # initialize last sequence to zeros (no interactions)
@@ -75,12 +115,22 @@ class SequentialRecEnv(gym.Env):
         return self._get_obs(), {}
 
     def _get_obs(self):
+        if self.scaled:
+            # last_seq is a ring buffer starting at _seq_head; write it out oldest-first
+            d, head = self.embed_dim, self._seq_head
+            obs = self._obs
+            obs[:d] = self.current_user_embed
+            obs[d:d + self.seq_len - head] = self.last_seq[head:]
+            obs[d + self.seq_len - head:] = self.last_seq[:head]
+            return obs
         # concat: user embedding + last_seq indices as floats
         obs = np.concatenate([self.current_user_embed.astype(np.float32), self.last_seq.astype(np.float32)])
         return obs
 
     def step(self, action):
         assert 0 <= action < self.num_groups
+        if self.scaled:
+            return self._step_scaled(action)
         self.step_count += 1
 
         # compute similarity score between user and item
@@ -126,8 +176,48 @@ class SequentialRecEnv(gym.Env):
 
         return self._get_obs(), float(reward), bool(done), False, info
 
+    def _step_scaled(self, action):
+        """Same dynamics as step(), float32 and allocation-free."""
+        self.step_count += 1
+        user = self.current_user_embed
+
+        sim = float(np.dot(user, self.unit_group_embeddings[action])) / (self._user_norm + 1e-8)
+        base_prob = (sim + 1.0) / 2.0
+        click_prob = 0.5 * (base_prob * self.click_prob_scale + 0.1)
+        join_prob = 0.2 * (base_prob * self.join_prob_scale + 0.05)
+
+        rand = self.rng.random()
+        info = self._info
+        info["sim"], info["click_prob"], info["join_prob"] = sim, click_prob, join_prob
+
+        if rand < join_prob:
+            reward, keep, outcome = 2.0, 0.9, "join"
+        elif rand < click_prob + join_prob:
+            reward, keep, outcome = 0.5, 0.98, "click"
+        else:
+            reward, keep, outcome = 0.0, 1.0, "ignore"
+        info["outcome"] = outcome
+
+        if keep < 1.0:
+            # user <- keep * user + (1 - keep) * item + N(0, 0.01), then refresh the cached norm
+            user *= keep
+            np.multiply(self.group_embeddings[action], 1.0 - keep, out=self._scratch)
+            user += self._scratch
+            self.rng.standard_normal(dtype=np.float32, out=self._noise)
+            self._noise *= 0.01
+            user += self._noise
+            self._user_norm = float(np.sqrt(np.dot(user, user)))
+
+        # update last sequence: overwrite the oldest slot
+        self.last_seq[self._seq_head] = action
+        self._seq_head = (self._seq_head + 1) % self.seq_len
+
+        done = self.step_count >= self.max_steps
+        return self._get_obs(), reward, done, False, info
+
     def render(self, mode="human"):
-        print(f"User {self.current_user_id} step {self.step_count} last_seq={self.last_seq}")
+        last_seq = self._get_obs()[self.embed_dim:].astype(int) if self.scaled else self.last_seq
+        print(f"User {self.current_user_id} step {self.step_count} last_seq={last_seq}")
 
     def seed(self, seed=None):
         self.rng = np.random.default_rng(seed)
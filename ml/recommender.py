@@ -1,15 +1,60 @@
 """
 Reusable recommendation engine module.
 Contains core logic for generating group recommendations using the DQN model.
+
+Only what inference needs is imported here: the gym environment is not
+built on the serving path (see InferenceSpace).
 """
 import os
+import time
 import numpy as np
 import torch
 from datetime import datetime
 
+from columnar import Interner, RecommendationBatch
+from comembership import CoMembershipEngine
 from dataset_state_mapper import embed_hobbies
-from reco_env import SequentialRecEnv
 from dqn_agent import QNetwork
+from experiments import SHADOW_MODELS, Experiment, ExperimentStats, parse_variants
+from people_matching import PeopleMatcher
+from profiling import label
+from rerank import mmr_rerank, monotone_scores, unit_embeddings
+from supabase_store import get_store
+from topk import csr_from_lists, csr_take_rows, topk_with_exclusions
+
+# Weights for blending normalized DQN Q-values with co-membership and popularity
+# scores. Setting both non-DQN weights to 0 returns raw Q-values as before.
+BLEND_WEIGHTS = {
+    "dqn": float(os.getenv("ML_BLEND_DQN_WEIGHT", 0.7)),
+    "comembership": float(os.getenv("ML_BLEND_COMEMBERSHIP_WEIGHT", 0.2)),
+    "popularity": float(os.getenv("ML_BLEND_POPULARITY_WEIGHT", 0.1)),
+}
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("ML_POPULARITY_HALF_LIFE_DAYS", 14))
+# Users scored per batched forward pass / top-k call
+SCORING_BATCH_SIZE = int(os.getenv("ML_SCORING_BATCH_SIZE", 512))
+# Optional diversity re-ranking stage ("none" or "mmr"): MMR picks top_k out of
+# RERANK_CANDIDATES relevance candidates, trading relevance for diversity by
+# RERANK_LAMBDA (1.0 = pure relevance) within RERANK_BUDGET_MS per user.
+RERANK = os.getenv("ML_RERANK", "none")
+RERANK_LAMBDA = float(os.getenv("ML_RERANK_LAMBDA", 0.7))
+RERANK_CANDIDATES = int(os.getenv("ML_RERANK_CANDIDATES", 32))
+RERANK_BUDGET_MS = float(os.getenv("ML_RERANK_BUDGET_MS", 0.5))
+
+
+class InferenceSpace:
+    """
+    The parts of SequentialRecEnv that inference reads (dimensions and group
+    embeddings), without importing gymnasium or building the simulator.
+    Group embeddings are drawn exactly as SequentialRecEnv draws them, so
+    the same seed yields the same embeddings.
+    """
+
+    def __init__(self, num_groups=50, embed_dim=8, seq_len=5, seed=None):
+        self.num_groups = num_groups
+        self.embed_dim = embed_dim
+        self.seq_len = seq_len
+        rng = np.random.default_rng(seed)
+        self.group_embeddings = rng.normal(size=(num_groups, embed_dim)).astype(np.float32)
 
 
 class RecommendationEngine:
@@ -17,116 +62,345 @@ class RecommendationEngine:
     Loads the DQN model and generates personalized group recommendations.
     """
     
-    def __init__(self, model_path="dqn_recommender.pth"):
-        """Initialize the recommendation engine with a trained model."""
+    def __init__(self, model_path="dqn_recommender.pth", blend_weights=None, shadow_models=SHADOW_MODELS):
+        """Initialize the recommendation engine with a trained model.
+
+        `shadow_models` ("name=path[:share],...", see experiments.py) adds
+        models scored alongside the primary one for A/B comparison.
+        """
         self.model_path = model_path
         self.model = None
+        # [primary model, shadow models...], aligned with self.experiment.names
+        self.models = []
+        self.experiment = None
+        # Summary of the last run's variant comparison (None without shadows)
+        self.last_experiment = None
         self.device = torch.device("cpu")
+        self.blend_weights = dict(BLEND_WEIGHTS, **(blend_weights or {}))
+        # uuid -> int code, shared by every run so codes stay stable
+        self.users = Interner()
+        # Kept across runs and synced incrementally from group_members (keyed by user code)
+        self.comembership = CoMembershipEngine(half_life_days=POPULARITY_HALF_LIFE_DAYS)
+        # User-to-user suggestions (interest embeddings + shared groups)
+        self.people = PeopleMatcher()
+        # Optional interaction_stream.UserStateStore with fresher per-user sequences
+        self.interaction_state = None
+        # user code -> interest names from the last batch run (for online scoring)
+        self.last_interests = {}
+        # Score vector width from the last batch run (covers groups beyond the action space)
+        self.catalog_size = 0
         # Fixed env config used during training/inference
-        self.env = SequentialRecEnv(
+        self.env = InferenceSpace(
             num_groups=50,
             embed_dim=8,
             seq_len=5,
-            max_steps=20,
         )
         self._load_model()
+        self._load_shadow_models(shadow_models)
     
-    def _load_model(self):
-        """Load the trained DQN model from disk."""
-        print(f"[{datetime.now().isoformat()}] Loading DQN model from {self.model_path}...")
+    def _load_model(self, model_path=None):
+        """Load a trained DQN model from disk (the primary model by default)."""
+        primary = model_path is None
+        model_path = self.model_path if primary else model_path
+        print(f"[{datetime.now().isoformat()}] Loading DQN model from {model_path}...")
         
-        if not os.path.exists(self.model_path):
-            raise FileNotFoundError(f"Model file not found: {self.model_path}")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model file not found: {model_path}")
         
         # Determine input/output dims based on env used for training
         input_dim = self.env.embed_dim * 2
         action_dim = self.env.num_groups
         # Initialize QNetwork and load weights
-        self.model = QNetwork(input_dim, action_dim).to(self.device)
-        checkpoint = torch.load(self.model_path, map_location=self.device)
-        self.model.load_state_dict(checkpoint)
-        self.model.eval()
+        model = QNetwork(input_dim, action_dim).to(self.device)
+        checkpoint = torch.load(model_path, map_location=self.device)
+        model.load_state_dict(checkpoint)
+        model.eval()
         print(f"[{datetime.now().isoformat()}] Model loaded successfully (input_dim={input_dim}, action_dim={action_dim})")
+        if primary:
+            self.model = model
+            self.models = [model]
+        return model
+
+    def _load_shadow_models(self, spec):
+        """Load shadow variants; one that fails to load is skipped and its users stay on the primary."""
+        names, shares = [], []
+        for name, path, share in parse_variants(spec):
+            try:
+                self.models.append(self._load_model(path))
+            except (OSError, RuntimeError) as e:
+                print(f"[WARNING] Skipping shadow model '{name}': {e}")
+                continue
+            names.append(name)
+            shares.append(share)
+        self.experiment = Experiment(names, shares) if names else None
+        if self.experiment is not None:
+            print(f"[{datetime.now().isoformat()}] Shadow scoring enabled: {self.experiment.info()}")
     
-    def generate_recommendations(self, user_data, groups_data, memberships_data, top_k=8):
+    def warmup(self, batch_size=32):
+        """Run a dummy batch through state building and every model; returns seconds taken."""
+        start = time.perf_counter()
+        states = torch.cat([self._build_user_state(["general"], [1, 2]) for _ in range(batch_size)])
+        with torch.no_grad():
+            for model in self.models:
+                model(states)
+        return time.perf_counter() - start
+
+    def generate_recommendations(self, data, top_k=8, user_codes=None, cancel_token=None):
         """
         Generate recommendations for all users.
         
         Args:
-            user_data: List of user dicts with {id, auth_user_id}
-            groups_data: List of group dicts with {id, name, type}
-            memberships_data: List of membership dicts with {user_id, group_id}
+            data: columnar.JobData for this run (users, groups, memberships, interests);
+                  build it with `self.users` as interner so user codes stay stable across runs
             top_k: Number of recommendations per user
+            user_codes: Optional subset of user codes to score (default: every user in `data`)
+            cancel_token: Optional scheduler CancelToken, checked after every scoring batch
             
         Returns:
-            List of recommendation dicts ready for insertion into recommendations_metadata
+            RecommendationBatch of group recommendations (ranked per user)
+
+        With shadow models loaded, every variant ranks each chunk from the
+        same states; each user gets their assigned variant's results and the
+        comparison (see experiments.ExperimentStats) is in meta["experiment"].
         """
+        user_codes = data.user_codes if user_codes is None else np.asarray(user_codes, dtype=np.int32)
         print(f"[{datetime.now().isoformat()}] Starting recommendation generation...")
-        print(f"  Users: {len(user_data)}, Groups: {len(groups_data)}, Memberships: {len(memberships_data)}")
-        
-        # Build user interests mapping
-        user_interests_map = self._fetch_user_interests()
-        
-        # Build membership lookup
-        membership_set = {(m["user_id"], m["group_id"]) for m in memberships_data}
+        print(f"  Users: {len(user_codes)}, Groups: {len(data.group_ids)}, Memberships: {len(data.member_groups)}")
+
+        # Refresh co-membership/popularity signals and size the blended score
+        # vector to cover groups beyond the model's action space
+        added, removed = self.comembership.sync(data.member_user_codes, data.member_groups, data.member_created_at)
+        print(f"  Co-membership sync: +{added} / -{removed} memberships")
+        catalog_size = int(max(self.env.num_groups, data.group_ids.max(initial=0)))
+        self.catalog_size = catalog_size
+        blending = self.blending
+        popularity = self.comembership.dense_popularity(catalog_size)
+
+        sources = {}
+        batch = RecommendationBatch.allocate(
+            self.users, len(user_codes) * top_k,
+            meta={"model": "dqn", "version": "1.0", "generated_at": datetime.now().isoformat()},
+        )
+        chunk_size = SCORING_BATCH_SIZE
+        rerank = self.reranking
+        num_candidates = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+        # One set of top-k buffers per variant: each variant's results stay live until assignment
+        out_buffers = [
+            (np.empty((chunk_size, num_candidates), dtype=np.int64), np.empty((chunk_size, num_candidates), dtype=np.float32))
+            for _ in self.models
+        ]
+        if rerank:
+            batch.meta["rerank"] = {"method": "mmr", "lambda": RERANK_LAMBDA, "candidates": num_candidates}
+        experiment = self.experiment
+        # Blended scores lie in [0, 1]; raw Q-values have no fixed scale
+        score_range = (0.0, 1.0) if blending else None
+        stats = ExperimentStats(experiment, top_k, score_range) if experiment is not None else None
         
-        all_recommendations = []
+        for start in range(0, len(user_codes), chunk_size):
+            chunk = user_codes[start:start + chunk_size]
+            state_start = time.perf_counter()
+            model_rows, states, model_groups, cold_rows = [], [], [], []
+
+            for row, user_code in enumerate(chunk.tolist()):
+                user_hobbies = data.interests.get(user_code, [])
+                user_groups = data.groups_of(user_code).tolist()
+                if self._is_cold_start(user_hobbies, user_groups, user_code, popularity):
+                    cold_rows.append(row)
+                else:
+                    model_rows.append(row)
+                    model_groups.append(user_groups)
+                    states.append(self._build_user_state(user_hobbies, user_groups, user_code))
+            states = torch.cat(states) if states else None
+            blend_base = self._blend_base(model_groups, popularity, catalog_size) if blending and model_rows else None
+            if stats is not None:
+                stats.shared_seconds += time.perf_counter() - state_start
+            if cold_rows:
+                sources["popularity"] = sources.get("popularity", 0) + len(cold_rows)
+            if model_rows:
+                model_name = "dqn+comembership" if blending else "dqn"
+                sources[model_name] = sources.get(model_name, 0) + len(model_rows)
+
+            # Exclude already-joined groups (DB ids are 1-based; columns 0-based)
+            exclude_indptr, exclude_groups = csr_take_rows(data.member_indptr, data.member_groups, chunk)
+            exclude_groups = exclude_groups - 1
+
+            # Every variant ranks the same users from the same state tensor
+            forward_start = time.perf_counter()
+            if model_rows:
+                # One forward pass per model for every model-scored user in the chunk
+                with torch.no_grad(), label("dqn.inference"):
+                    q_values = [model(states).cpu().numpy() for model in self.models]
+            if stats is not None:
+                stats.forward_seconds += time.perf_counter() - forward_start
+
+            results = []
+            for variant in range(len(self.models)):
+                rank_start = time.perf_counter()
+                scores = np.empty((len(chunk), catalog_size), dtype=np.float32)
+                scores[cold_rows] = popularity
+                if model_rows:
+                    base = blend_base.copy() if blending and len(self.models) > 1 else blend_base
+                    self._fill_model_scores(scores, model_rows, q_values[variant], base)
+                results.append(self._rank(scores, top_k, exclude_indptr, exclude_groups, out=out_buffers[variant]))
+                if stats is not None:
+                    stats.rank_seconds[variant] += time.perf_counter() - rank_start
+
+            top_indices, top_scores, counts = results[0]
+            if experiment is not None:
+                # Write only each user's assigned variant
+                assigned = experiment.assign(self.users, chunk)
+                stats.record(results, assigned, np.asarray(model_rows, dtype=np.int64))
+                rows = np.arange(len(chunk))
+                top_indices = np.stack([r[0] for r in results])[assigned, rows]
+                top_scores = np.stack([r[1] for r in results])[assigned, rows]
+                counts = np.stack([r[2] for r in results])[assigned, rows]
+
+            # Map column index to actual group id (assumes contiguous ids starting at 1)
+            batch.append_topk(chunk, "group", top_indices + 1, top_scores, counts)
+
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            print(f"[{datetime.now().isoformat()}] Processed {start + len(chunk)}/{len(user_codes)} users...")
         
-        for i, user in enumerate(user_data, 1):
-            user_id = user["id"]
-            user_hobbies = user_interests_map.get(user_id, [])
-            user_groups = [m["group_id"] for m in memberships_data if m["user_id"] == user_id]
-            
-            # Build user state vector
-            state_tensor = self._build_user_state(user_hobbies, user_groups)
-            # Get Q-values for all groups
+        batch.meta["sources"] = sources
+        if stats is not None:
+            self.last_experiment = batch.meta["experiment"] = stats.summary()
+            self.last_experiment["generated_at"] = batch.meta["generated_at"]
+        self.last_interests = data.interests
+        print(f"[{datetime.now().isoformat()}] Generated {len(batch)} recommendations")
+        return batch.trim()
+
+    @property
+    def blending(self):
+        return self.blend_weights["comembership"] > 0 or self.blend_weights["popularity"] > 0
+
+    @property
+    def reranking(self):
+        return RERANK == "mmr" and RERANK_LAMBDA < 1.0
+
+    def _is_cold_start(self, hobbies, groups, user_code, popularity):
+        """No interests, memberships or stream state: the DQN would see the same
+        "general" state for every such user, so they get the popularity ranking."""
+        has_stream_state = (self.interaction_state is not None and user_code is not None
+                            and self.interaction_state.has_state(user_code))
+        return not hobbies and not groups and not has_stream_state and popularity.any()
+
+    def _fill_model_scores(self, scores, rows, q_values, blend_base=None):
+        """Write model scores for `rows` of `scores`: blended into `blend_base`
+        when blending, else raw Q-values with groups outside the action space masked."""
+        if blend_base is not None:
+            scores[rows] = self._blend_scores(q_values, blend_base)
+        else:
+            action_dim = q_values.shape[1]
+            scores[rows, :action_dim] = q_values
+            scores[rows, action_dim:] = -np.inf
+
+    def _rank(self, scores, top_k, exclude_indptr, exclude_indices, out=None):
+        """Top-k columns per row excluding joined groups, MMR re-ranked when enabled
+        (scores then strictly decrease with rank, see rerank.monotone_scores).
+
+        `scores` is consumed (the top-k kernel works in place); `out` is an
+        optional (indices, scores) buffer pair for the candidate selection.
+        """
+        num_candidates = max(top_k, RERANK_CANDIDATES) if self.reranking else top_k
+        out_indices, out_scores = out if out is not None else (None, None)
+        top_indices, top_scores, counts = topk_with_exclusions(
+            scores, num_candidates, exclude_indptr, exclude_indices,
+            out_indices=out_indices, out_scores=out_scores, inplace=True,
+        )
+        if self.reranking:
+            top_indices, top_scores, counts = mmr_rerank(
+                top_indices, top_scores, counts, unit_embeddings(self.env.group_embeddings), top_k,
+                lam=RERANK_LAMBDA, budget_seconds_per_user=RERANK_BUDGET_MS / 1000.0,
+            )
+            # Stored and cached rows are ordered by score downstream; keep the MMR order
+            monotone_scores(top_scores, counts)
+        return top_indices, top_scores, counts
+
+    def _blend_scores(self, q_values, base):
+        """Blend min-max normalized Q-values into `base` (from _blend_base), in place.
+
+        Groups outside the model's action space get a DQN score of 0 and can
+        only surface through the co-membership/popularity terms.
+        """
+        low = q_values.min(axis=1, keepdims=True)
+        spread = q_values.max(axis=1, keepdims=True) - low
+        base[:, :q_values.shape[1]] += self.blend_weights["dqn"] * (q_values - low) / (spread + 1e-8)
+        return base
+
+    def _blend_base(self, user_groups, popularity, catalog_size):
+        """Co-membership and popularity part of the blended score, shared by every model.
+
+        Args:
+            user_groups: per-row lists of the user's group ids
+            popularity: (catalog_size,) popularity scores shared by every row
+
+        Returns:
+            (B, catalog_size) scores
+        """
+        w = self.blend_weights
+        base = np.zeros((len(user_groups), catalog_size), dtype=np.float32)
+        if w["comembership"] > 0:
+            for row, groups in enumerate(user_groups):
+                base[row] += w["comembership"] * self.comembership.dense_comembership(groups, catalog_size)
+        base += w["popularity"] * popularity
+        return base
+
+    def score_user(self, user_id, top_k=8):
+        """Score one user online from in-memory state (no table fetches).
+
+        Uses interests from the last batch run, live memberships from the
+        co-membership engine and, when streaming is enabled, the user's
+        latest interaction sequence and preference drift. Goes through the
+        same cold-start, blending and re-ranking steps as the batch job, so
+        scores are on the same scale as the cached batch results. Ids the
+        engine has never seen are not interned (the id comes straight from
+        the request path); they score as a user with no interests,
+        memberships or stream state.
+
+        Returns:
+            List of (group_id, score) tuples, best first
+        """
+        user_code = self.users.codes.get(user_id)
+        user_groups = self.comembership.groups_of(user_code) if user_code is not None else []
+        hobbies = self.last_interests.get(user_code, []) if user_code is not None else []
+        catalog_size = int(max(self.env.num_groups, self.catalog_size, max(user_groups, default=0)))
+        popularity = self.comembership.dense_popularity(catalog_size)
+
+        scores = np.empty((1, catalog_size), dtype=np.float32)
+        if self._is_cold_start(hobbies, user_groups, user_code, popularity):
+            scores[0] = popularity
+        else:
+            state_tensor = self._build_user_state(hobbies, user_groups, user_code)
+            # Same variant as the user's batch results
+            variant = self.experiment.variant_of(user_id) if self.experiment is not None else 0
             with torch.no_grad():
-                q_values = self.model(state_tensor).squeeze(0).cpu().numpy()
-            
-            # Mask already-joined groups
-            for group_id in user_groups:
-                idx = int(group_id) - 1  # DB ids are 1-based; model indices 0-based
-                if 0 <= idx < len(q_values):
-                    q_values[idx] = -1e9
-            
-            # Get top-k recommendations
-            top_indices = np.argsort(q_values)[::-1][:top_k]
-            
-            for rank, group_idx in enumerate(top_indices, 1):
-                if q_values[group_idx] == -np.inf:
-                    continue
-                
-                # Map model index to actual group id (assumes contiguous ids starting at 1)
-                mapped_group_id = group_idx + 1
-                score = float(q_values[group_idx])
-                
-                all_recommendations.append({
-                    "user_id": user_id,
-                    "entity_type": "group",
-                    "entity_id": mapped_group_id,
-                    "score": score,
-                    "rank": rank,
-                    "metadata": {
-                        "model": "dqn",
-                        "version": "1.0",
-                        "generated_at": datetime.now().isoformat()
-                    }
-                })
-            
-            if i % 10 == 0:
-                print(f"[{datetime.now().isoformat()}] Processed {i}/{len(user_data)} users...")
-        
-        print(f"[{datetime.now().isoformat()}] Generated {len(all_recommendations)} recommendations")
-        return all_recommendations
+                q_values = self.models[variant](state_tensor).cpu().numpy()
+            blend_base = self._blend_base([user_groups], popularity, catalog_size) if self.blending else None
+            self._fill_model_scores(scores, [0], q_values, blend_base)
+
+        exclude_indptr, exclude_indices = csr_from_lists([[g - 1 for g in user_groups]])
+        top_indices, top_scores, counts = self._rank(scores, top_k, exclude_indptr, exclude_indices)
+        n = counts[0]
+        return [(int(i) + 1, float(v)) for i, v in zip(top_indices[0, :n], top_scores[0, :n])]
 
-    def _build_user_state(self, hobbies_list, joined_groups_list):
-        """Build state vector combining user interest embedding and last interactions embedding."""
+    def _build_user_state(self, hobbies_list, joined_groups_list, user_code=None):
+        """Build state vector combining user interest embedding and last interactions embedding.
+
+        When an interaction stream has state for `user_code`, its ring buffer
+        replaces the membership-order proxy and its preference drift is
+        applied to the interest embedding.
+        """
         embed_dim = self.env.embed_dim
         seq_len = self.env.seq_len
         # User embedding from hobbies
         if not hobbies_list:
             hobbies_list = ["general"]
         user_embed = embed_hobbies(hobbies_list, embed_dim)
+        stream = self.interaction_state
+        current = stream.current(user_code, user_embed) if stream is not None and user_code is not None else None
+        if current is not None:
+            user_embed, joined_groups_list = current
         # Last interactions sequence (use joined groups as proxy)
         last_seq = (joined_groups_list or [])[-seq_len:]
         if len(last_seq) < seq_len:
@@ -139,24 +413,18 @@ class RecommendationEngine:
         state = np.concatenate([user_embed, last_emb]).astype(np.float32)
         return torch.tensor(state).unsqueeze(0).to(self.device)
     
-    def _fetch_user_interests(self):
+    def fetch_user_interests(self):
         """Fetch user interests from Supabase and map to user IDs."""
-        from supabase import create_client
-        
-        supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        if not supabase_url or not supabase_key:
+        store = get_store()
+        if store is None:
             print("[WARNING] Supabase credentials not found, using empty interests")
             return {}
-        
-        supabase = create_client(supabase_url, supabase_key)
-        
+
         # Fetch user_interests with interest names
-        response = supabase.table("user_interests").select("user_id, interests(name)").execute()
-        
+        rows = store.select_all("user_interests", "user_id, interests(name)", order="user_id,interest_id")
+
         user_interests_map = {}
-        for row in response.data:
+        for row in rows:
             user_id = row["user_id"]
             interest_name = row["interests"]["name"] if row["interests"] else None
             if interest_name:
@@ -167,46 +435,42 @@ class RecommendationEngine:
         return user_interests_map
     
     def push_to_supabase(self, recommendations):
-        """Push recommendations to Supabase recommendations_metadata table."""
-        from supabase import create_client
-        
-        supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        if not supabase_url or not supabase_key:
+        """Push a RecommendationBatch to Supabase recommendations_metadata table.
+
+        Rows are converted to dicts one upsert batch at a time (inside the
+        store's worker threads), so the whole result set never exists as
+        Python objects at once. Deletes and upserts are idempotent, so the
+        store retries them on transient failures.
+        """
+        store = get_store()
+        if store is None:
             raise ValueError("Missing Supabase credentials in environment")
-        
-        supabase = create_client(supabase_url, supabase_key)
-        
-        # Helper to convert numpy scalars to native Python
-        def _to_py(v):
-            try:
-                import numpy as _np
-                if isinstance(v, (_np.generic,)):
-                    return v.item()
-            except Exception:
-                pass
-            return v
-
-        # Delete existing recommendations for these users (preserve original types)
-        user_ids = list({ _to_py(r["user_id"]) for r in recommendations })
+
+        # Delete existing recommendations for these users
+        user_ids = recommendations.user_ids()
         print(f"[{datetime.now().isoformat()}] Clearing old recommendations for {len(user_ids)} users...")
-        supabase.table("recommendations_metadata").delete().in_("user_id", user_ids).execute()
+        store.delete_in("recommendations_metadata", "user_id", user_ids)
         
-        # Insert new recommendations in batches
-        batch_size = 100
-        for i in range(0, len(recommendations), batch_size):
-            batch_raw = recommendations[i:i + batch_size]
-            # Sanitize numpy types to native Python types without coercing UUIDs/strings to ints
-            batch = []
-            for r in batch_raw:
-                batch.append({
-                    "user_id": _to_py(r["user_id"]),            # uuid
-                    "entity_type": str(r["entity_type"]),        # 'group' | 'event' | 'user'
-                    "entity_id": str(_to_py(r["entity_id"])),    # text column
-                    "score": float(r["score"]),                   # real
-                })
-            supabase.table("recommendations_metadata").insert(batch).execute()
-            print(f"[{datetime.now().isoformat()}] Inserted batch {i//batch_size + 1}/{(len(recommendations) + batch_size - 1)//batch_size}")
+        # Upsert new recommendations in batches
+        batch_size = 500
+        total = len(recommendations)
+        num_batches = (total + batch_size - 1) // batch_size
+
+        def build_batch(i):
+            return [
+                {
+                    "user_id": r["user_id"],                # uuid
+                    "entity_type": r["entity_type"],        # 'group' | 'event' | 'user'
+                    "entity_id": str(r["entity_id"]),       # text column
+                    "score": r["score"],                    # real
+                }
+                for r in recommendations.to_rows(i * batch_size, (i + 1) * batch_size)
+            ]
+
+        store.upsert_batches(
+            "recommendations_metadata", num_batches, build_batch,
+            on_conflict="user_id,entity_type,entity_id",
+            on_batch=lambda i: print(f"[{datetime.now().isoformat()}] Upserted batch {i + 1}/{num_batches}"),
+        )
         
-        print(f"[{datetime.now().isoformat()}] Successfully pushed {len(recommendations)} recommendations to Supabase")
+        print(f"[{datetime.now().isoformat()}] Successfully pushed {total} recommendations to Supabase")
@@ -0,0 +1,106 @@
+"""
+Diversity-aware re-ranking (maximal marginal relevance) over group embeddings.
+
+Runs on the candidate matrix produced by topk.topk_with_exclusions for a
+whole batch of users at once. Each greedy step picks, per row,
+
+    argmax  lambda * relevance - (1 - lambda) * max_similarity_to_picked
+
+where relevance is the row's scores min-max scaled to [0, 1] and
+similarity is cosine similarity of group embeddings.
+
+Per-user cost is bounded: at most k steps over at most C candidates,
+i.e. O(k * C * D). An optional wall-clock budget per user stops the
+greedy loop early and fills the remaining slots in relevance order.
+
+recommendations_metadata has no rank column, and every consumer (the app,
+the cache loader) orders by score. So before results are stored,
+monotone_scores clips the re-ranked relevance scores to strictly decrease
+with rank.
+"""
+import time
+
+import numpy as np
+
+
+def unit_embeddings(embeddings):
+    """Row-normalize an embedding table once so dot products are cosines."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-8)).astype(np.float32)
+
+
+def mmr_rerank(cand_indices, cand_scores, counts, embeddings, k, lam=0.7, budget_seconds_per_user=None):
+    """Re-rank (B, C) candidates down to (B, k) with MMR.
+
+    Args:
+        cand_indices: (B, C) embedding row per candidate, best-first; -1 = empty slot
+        cand_scores: (B, C) relevance scores aligned with cand_indices
+        counts: (B,) number of valid candidates per row
+        embeddings: (N, D) unit-normalized embeddings; candidates with
+            index >= N are treated as having no embedding (never penalized)
+        k: results per row
+        lam: relevance/diversity trade-off (1.0 = pure relevance)
+        budget_seconds_per_user: optional time budget, scaled by B
+
+    Returns:
+        (indices, scores, counts) of shape (B, k), (B, k), (B,)
+    """
+    B, C = cand_indices.shape
+    k = min(k, C)
+    counts = np.asarray(counts)
+    rows = np.arange(B)
+    valid = np.arange(C) < counts[:, None]
+
+    emb = np.zeros((B, C, embeddings.shape[1]), dtype=np.float32)
+    has_emb = valid & (cand_indices >= 0) & (cand_indices < len(embeddings))
+    emb[has_emb] = embeddings[cand_indices[has_emb]]
+
+    low = np.where(valid, cand_scores, np.inf).min(axis=1, keepdims=True)
+    high = np.where(valid, cand_scores, -np.inf).max(axis=1, keepdims=True)
+    relevance = np.where(valid, (cand_scores - low) / (high - low + 1e-8), -np.inf)
+
+    chosen = np.zeros((B, k), dtype=np.int64)
+    taken = ~valid
+    max_sim = np.zeros((B, C), dtype=np.float32)
+    deadline = time.perf_counter() + budget_seconds_per_user * B if budget_seconds_per_user else None
+
+    step = 0
+    while step < k:
+        objective = lam * relevance - (1.0 - lam) * max_sim
+        objective[taken] = -np.inf
+        pick = objective.argmax(axis=1)
+        chosen[:, step] = pick
+        taken[rows, pick] = True
+        sims = np.einsum("bcd,bd->bc", emb, emb[rows, pick])
+        max_sim = sims if step == 0 else np.maximum(max_sim, sims)
+        step += 1
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+
+    if step < k:
+        # Out of budget: fill remaining slots with the most relevant unpicked candidates
+        rest = np.argsort(np.where(taken, np.inf, -relevance), axis=1, kind="stable")[:, :k - step]
+        chosen[:, step:] = rest
+
+    out_counts = np.minimum(counts, k)
+    out_indices = np.take_along_axis(cand_indices, chosen, axis=1)
+    out_scores = np.take_along_axis(cand_scores, chosen, axis=1)
+    empty = np.arange(k) >= out_counts[:, None]
+    out_indices[empty] = -1
+    out_scores[empty] = -np.inf
+    return out_indices, out_scores, out_counts
+
+
+def monotone_scores(scores, counts):
+    """Clip (B, k) ranked scores in place so each is strictly below the previous one.
+
+    Sorting by the returned scores reproduces the given rank order. Rows
+    already in relevance order only change on ties, which move down by one
+    float32 step.
+    """
+    counts = np.asarray(counts)
+    for j in range(1, scores.shape[1]):
+        live = counts > j
+        below = np.nextafter(scores[live, j - 1], np.float32(-np.inf))
+        scores[live, j] = np.minimum(scores[live, j], below)
+    return scores
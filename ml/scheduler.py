@@ -0,0 +1,238 @@
+"""
+Job scheduler for the ML recommendation service.
+
+Replaces the old `time.sleep(3600)` loop with:
+1. Cron-style schedules aligned to wall-clock boundaries, with random jitter
+2. Separate schedules for full and incremental recompute
+3. Lock-protected single-flight execution on one worker thread
+4. Cooperative cancellation and per-job timeouts via CancelToken
+5. A pending-trigger queue that coalesces duplicate requests
+"""
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when its CancelToken was cancelled or timed out."""
+
+
+class CancelToken:
+    """Cooperative cancellation handle passed to every job.
+
+    Jobs call `raise_if_cancelled()` at safe points (between phases, every
+    few users). Threads cannot be killed in Python, so a timeout is just a
+    deadline that the next check turns into a cancellation.
+    """
+
+    def __init__(self, timeout_seconds=None):
+        self._event = threading.Event()
+        self.reason = None
+        self.deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+
+    def cancel(self, reason="cancelled"):
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("timeout")
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.reason)
+
+
+class Schedule:
+    """A recurring job kind (e.g. "full" or "incremental").
+
+    Runs fire at multiples of `interval_seconds` since the epoch (shifted by
+    `offset_seconds`), plus a random delay of up to `jitter_seconds`. Missed
+    slots are skipped rather than replayed, so a slow job never causes a
+    backlog of catch-up runs.
+    """
+
+    def __init__(self, kind, interval_seconds, jitter_seconds=0, offset_seconds=0, timeout_seconds=None):
+        if interval_seconds <= 0:
+            raise ValueError("interval_seconds must be positive")
+        self.kind = kind
+        self.interval_seconds = interval_seconds
+        self.jitter_seconds = max(0, jitter_seconds)
+        self.offset_seconds = offset_seconds
+        self.timeout_seconds = timeout_seconds
+        self.next_run = None
+
+    def compute_next(self, after):
+        """Return the next fire time (epoch seconds) strictly after `after`."""
+        slots = (after - self.offset_seconds) // self.interval_seconds + 1
+        base = slots * self.interval_seconds + self.offset_seconds
+        return base + random.uniform(0, self.jitter_seconds)
+
+
+class JobScheduler:
+    """Runs `job_fn(kind, token)` on a single worker thread.
+
+    Scheduled runs and manual triggers share one pending queue. A kind that
+    is already pending is coalesced, and a pending "full" run absorbs any
+    "incremental" request because it recomputes a superset.
+    """
+
+    SUPERSEDES = {"full": {"incremental"}}
+
+    def __init__(self, job_fn, schedules, run_on_start=None):
+        self.job_fn = job_fn
+        self.schedules = {s.kind: s for s in schedules}
+        self.run_on_start = run_on_start
+        self._cond = threading.Condition()
+        self._run_lock = threading.Lock()
+        self._pending = deque()
+        self._current = None
+        self._current_token = None
+        self._last = {}
+        self._stopped = False
+        self._thread = None
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def start(self):
+        now = time.time()
+        with self._cond:
+            for schedule in self.schedules.values():
+                schedule.next_run = schedule.compute_next(now)
+            if self.run_on_start:
+                self._enqueue_locked(self.run_on_start, "startup")
+        self._thread = threading.Thread(target=self._worker, name="ml-job-scheduler", daemon=True)
+        self._thread.start()
+        self._log(f"Scheduler started ({self._describe_schedules()})")
+
+    def stop(self, cancel_running=True):
+        with self._cond:
+            self._stopped = True
+            if cancel_running and self._current_token is not None:
+                self._current_token.cancel("shutdown")
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def trigger(self, kind="full", source="manual"):
+        """Queue a run of `kind`. Returns "queued" or "coalesced"."""
+        if kind not in self.schedules:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self._cond:
+            return self._enqueue_locked(kind, source)
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the running job, if any. Returns True if one was signalled."""
+        with self._cond:
+            if self._current_token is None:
+                return False
+            self._current_token.cancel(reason)
+            return True
+
+    @property
+    def is_running(self):
+        return self._current is not None
+
+    def status(self):
+        with self._cond:
+            return {
+                "running": dict(self._current) if self._current else None,
+                "pending": [{"kind": k, "source": s} for k, s in self._pending],
+                "schedules": {
+                    kind: {
+                        "interval_seconds": s.interval_seconds,
+                        "jitter_seconds": s.jitter_seconds,
+                        "offset_seconds": s.offset_seconds,
+                        "timeout_seconds": s.timeout_seconds,
+                        "next_run": _iso(s.next_run),
+                    }
+                    for kind, s in self.schedules.items()
+                },
+                "last": {kind: dict(info) for kind, info in self._last.items()},
+            }
+
+    # -----------------------------
+    # Internals
+    # -----------------------------
+    def _enqueue_locked(self, kind, source):
+        running_kind = self._current["kind"] if self._current else None
+        for pending_kind, _ in self._pending:
+            if pending_kind == kind or kind in self.SUPERSEDES.get(pending_kind, ()):
+                return "coalesced"
+        # A newer full run makes queued incremental runs redundant
+        superseded = self.SUPERSEDES.get(kind, ())
+        if superseded:
+            self._pending = deque((k, s) for k, s in self._pending if k not in superseded)
+        self._pending.append((kind, source))
+        self._cond.notify_all()
+        if running_kind is not None:
+            self._log(f"Queued {kind} run behind running {running_kind} job ({source})")
+        return "queued"
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._pending:
+                    now = time.time()
+                    due = [s for s in self.schedules.values() if s.next_run <= now]
+                    for schedule in sorted(due, key=lambda s: s.next_run):
+                        schedule.next_run = schedule.compute_next(now)
+                        self._enqueue_locked(schedule.kind, "schedule")
+                    if self._pending:
+                        break
+                    wake_at = min(s.next_run for s in self.schedules.values())
+                    self._cond.wait(timeout=max(0.0, wake_at - now))
+                if self._stopped:
+                    return
+                kind, source = self._pending.popleft()
+            self._execute(kind, source)
+
+    def _execute(self, kind, source):
+        if not self._run_lock.acquire(blocking=False):
+            self._log(f"Job already running, skipping {kind} run ({source})")
+            return None
+        schedule = self.schedules[kind]
+        token = CancelToken(schedule.timeout_seconds)
+        started = time.time()
+        with self._cond:
+            self._current = {"kind": kind, "source": source, "started_at": _iso(started)}
+            self._current_token = token
+        status, error = "success", None
+        try:
+            self.job_fn(kind, token)
+        except JobCancelled as e:
+            status, error = "cancelled", str(e)
+        except Exception as e:
+            status, error = "failed", str(e)
+        finally:
+            duration = time.time() - started
+            with self._cond:
+                self._current = None
+                self._current_token = None
+                self._last[kind] = {
+                    "status": status,
+                    "error": error,
+                    "source": source,
+                    "finished_at": _iso(time.time()),
+                    "duration_seconds": round(duration, 3),
+                }
+            self._run_lock.release()
+        return status
+
+    def _describe_schedules(self):
+        return ", ".join(
+            f"{s.kind} every {s.interval_seconds}s +{s.jitter_seconds}s jitter" for s in self.schedules.values()
+        )
+
+    @staticmethod
+    def _log(message):
+        print(f"[{datetime.now().isoformat()}] {message}")
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat() if ts is not None else None
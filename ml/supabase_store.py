@@ -0,0 +1,297 @@
+"""
+Shared data-access layer for Supabase (PostgREST) used by the ML service.
+
+One `SupabaseStore` owns a single pooled HTTP session for the process:
+- bounded concurrency: at most `max_concurrency` requests in flight, and
+  the connection pool is sized to match
+- per-call timeouts
+- exponential backoff with full jitter on connection errors, timeouts and
+  408/425/429/5xx responses, for idempotent calls only (reads, deletes by
+  key, upserts on a unique key); Retry-After is honoured
+- paginated reads, so tables larger than PostgREST's max-rows are read in full
+- per-operation latency histograms, reported on /status
+
+It talks to PostgREST directly (`{url}/rest/v1/<table>`), so it can be
+pointed at a local fake PostgREST server in tests. `requests` is imported
+on first construction to keep service startup fast.
+"""
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+MAX_CONCURRENCY = int(os.getenv("ML_SUPABASE_MAX_CONCURRENCY", 8))
+TIMEOUT_SECONDS = float(os.getenv("ML_SUPABASE_TIMEOUT_SECONDS", 30))
+MAX_RETRIES = int(os.getenv("ML_SUPABASE_MAX_RETRIES", 4))
+BACKOFF_BASE_SECONDS = float(os.getenv("ML_SUPABASE_BACKOFF_BASE_SECONDS", 0.5))
+BACKOFF_MAX_SECONDS = float(os.getenv("ML_SUPABASE_BACKOFF_MAX_SECONDS", 8))
+PAGE_SIZE = int(os.getenv("ML_SUPABASE_PAGE_SIZE", 1000))
+
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class SupabaseError(Exception):
+    """A PostgREST call failed (after any retries)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds), safe to update from threads."""
+
+    BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.total = 0
+        self.errors = 0
+        self.retries = 0
+        self.sum_ms = 0.0
+
+    def record(self, seconds, ok=True):
+        ms = seconds * 1000.0
+        with self._lock:
+            self.counts[bisect_left(self.BOUNDS_MS, ms)] += 1
+            self.total += 1
+            self.sum_ms += ms
+            if not ok:
+                self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def quantile(self, q):
+        """Upper bucket bound containing quantile q (None for the overflow bucket)."""
+        with self._lock:
+            target, seen = q * self.total, 0
+            for bound, count in zip(self.BOUNDS_MS + (None,), self.counts):
+                seen += count
+                if count and seen >= target:
+                    return bound
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {f"le_{b}ms": c for b, c in zip(self.BOUNDS_MS, self.counts)}
+            buckets[f"gt_{self.BOUNDS_MS[-1]}ms"] = self.counts[-1]
+            summary = {
+                "count": self.total,
+                "errors": self.errors,
+                "retries": self.retries,
+                "mean_ms": round(self.sum_ms / self.total, 2) if self.total else None,
+                "buckets": buckets,
+            }
+        summary["p50_ms"] = self.quantile(0.5)
+        summary["p95_ms"] = self.quantile(0.95)
+        return summary
+
+
+def _in_filter(values):
+    quoted = ",".join('"%s"' % str(v).replace('"', '\\"') for v in values)
+    return f"in.({quoted})"
+
+
+class SupabaseStore:
+    """Pooled, retrying PostgREST client.
+
+    Filters use PostgREST syntax, e.g. {"user_id": "eq.<uuid>", "id": "gt.42"}.
+    """
+
+    def __init__(self, url, key, max_concurrency=MAX_CONCURRENCY, timeout=TIMEOUT_SECONDS,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE_SECONDS,
+                 backoff_max=BACKOFF_MAX_SECONDS, page_size=PAGE_SIZE):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._requests = requests
+        self.base_url = url.rstrip("/") + "/rest/v1/"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.page_size = page_size
+        self.max_concurrency = max_concurrency
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+        })
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._histograms = {}
+        self._hist_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Store for NEXT_PUBLIC_SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY, or None if unset."""
+        url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        if not url or not key:
+            return None
+        return cls(url, key, **kwargs)
+
+    # -----------------------------
+    # Request core
+    # -----------------------------
+    def _histogram(self, op):
+        with self._hist_lock:
+            if op not in self._histograms:
+                self._histograms[op] = LatencyHistogram()
+            return self._histograms[op]
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, table, params=None, json=None, headers=None,
+                idempotent=True, timeout=None, max_retries=None):
+        """One PostgREST call under the concurrency limit; returns the Response."""
+        op = f"{method} {table}"
+        hist = self._histogram(op)
+        retries = (self.max_retries if max_retries is None else max_retries) if idempotent else 0
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        while True:
+            error, retry_after = None, None
+            start = time.perf_counter()
+            with self._slots:
+                try:
+                    response = self.session.request(method, self.base_url + table, params=params, json=json,
+                                                    headers=headers, timeout=timeout)
+                except (self._requests.ConnectionError, self._requests.Timeout) as e:
+                    response, error = None, e
+            elapsed = time.perf_counter() - start
+
+            if response is not None:
+                if response.status_code < 400:
+                    hist.record(elapsed)
+                    return response
+                error = SupabaseError(f"{op} -> HTTP {response.status_code}: {response.text[:200]}",
+                                      status=response.status_code)
+                retry_after = response.headers.get("Retry-After")
+                if response.status_code not in RETRY_STATUSES:
+                    hist.record(elapsed, ok=False)
+                    raise error
+
+            hist.record(elapsed, ok=False)
+            if attempt >= retries:
+                if isinstance(error, SupabaseError):
+                    raise error
+                raise SupabaseError(f"{op} failed: {error}") from error
+            delay = self._backoff(attempt, retry_after)
+            attempt += 1
+            hist.record_retry()
+            print(f"[{datetime.now().isoformat()}] {op} failed ({error}); retry {attempt}/{retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+    def map_concurrent(self, fn, items):
+        """Run fn over items on up to max_concurrency threads; results in order."""
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as pool:
+            return list(pool.map(fn, items))
+
+    # -----------------------------
+    # Table operations
+    # -----------------------------
+    def select(self, table, columns="*", filters=None, order=None, limit=None, offset=None,
+               timeout=None, max_retries=None):
+        params = {"select": columns.replace(" ", "")}
+        params.update(filters or {})
+        if order:
+            params["order"] = order
+        if limit is not None:
+            params["limit"] = limit
+        if offset:
+            params["offset"] = offset
+        return self.request("GET", table, params=params, timeout=timeout, max_retries=max_retries).json()
+
+    def select_all(self, table, columns="*", order=None, filters=None, timeout=None):
+        """Every matching row, fetched page by page. `order` should be a unique key
+        so pages are stable."""
+        rows, offset = [], 0
+        while True:
+            page = self.select(table, columns, filters=filters, order=order,
+                               limit=self.page_size, offset=offset, timeout=timeout)
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows
+            offset += len(page)
+
+    def select_many(self, queries):
+        """Run several select_all queries concurrently: {name: (table, columns, order)} -> {name: rows}."""
+        names = list(queries)
+        results = self.map_concurrent(lambda name: self.select_all(*queries[name]), names)
+        return dict(zip(names, results))
+
+    def delete_in(self, table, column, values, chunk_size=200):
+        """Delete rows whose `column` is in `values`, chunked to keep URLs short."""
+        values = list(values)
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        self.map_concurrent(
+            lambda chunk: self.request("DELETE", table, params={column: _in_filter(chunk)},
+                                       headers={"Prefer": "return=minimal"}),
+            chunks,
+        )
+
+    def upsert(self, table, rows, on_conflict, batch_size=500, on_batch=None):
+        """Upsert a list of rows (merge on the `on_conflict` unique key) in concurrent batches."""
+        batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+        return self.upsert_batches(table, len(batches), lambda i: batches[i], on_conflict, on_batch)
+
+    def upsert_batches(self, table, num_batches, build_batch, on_conflict, on_batch=None):
+        """Upsert `num_batches` batches, building batch i with build_batch(i) in the worker."""
+        headers = {"Prefer": "resolution=merge-duplicates,return=minimal"}
+        params = {"on_conflict": on_conflict}
+
+        def send(i):
+            self.request("POST", table, params=params, json=build_batch(i), headers=headers)
+            if on_batch is not None:
+                on_batch(i)
+
+        self.map_concurrent(send, range(num_batches))
+
+    # -----------------------------
+    # Introspection
+    # -----------------------------
+    def stats(self):
+        with self._hist_lock:
+            ops = dict(self._histograms)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout,
+            "max_retries": self.max_retries,
+            "operations": {op: hist.snapshot() for op, hist in sorted(ops.items())},
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store, created from the environment on first use (None without credentials)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SupabaseStore.from_env()
+        return _store
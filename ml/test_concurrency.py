@@ -0,0 +1,150 @@
+# test_concurrency.py
+# The interaction stream thread updates the engine's co-membership graph and
+# user state while the batch job syncs and scores from them. These tests run
+# both sides at once and check nothing raises and the state stays consistent.
+# The cache test covers a job write landing during a read-through load.
+# Run directly (python test_concurrency.py) or with pytest.
+import sys
+import threading
+from collections import Counter
+
+import numpy as np
+
+from columnar import Interner, RecommendationBatch
+from comembership import CoMembershipEngine
+from interaction_stream import UserStateStore
+from reco_cache import RecommendationCache
+
+NUM_USERS = 300
+NUM_GROUPS = 40
+ROUNDS = 30
+
+
+def run_alongside(target, writer):
+    """Run `writer(stop)` in a thread while `target()` runs; re-raise the writer's error."""
+    stop = threading.Event()
+    errors = []
+    # Switch threads often so unguarded interleavings actually happen
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    def wrapped():
+        try:
+            writer(stop)
+        except Exception as e:  # surfaced in the main thread below
+            errors.append(e)
+
+    thread = threading.Thread(target=wrapped)
+    thread.start()
+    try:
+        target()
+    finally:
+        stop.set()
+        thread.join()
+        sys.setswitchinterval(interval)
+    if errors:
+        raise errors[0]
+
+
+def expected_cooccurrence(engine):
+    expected = {}
+    for groups in engine.user_groups.values():
+        for a in groups:
+            for b in groups:
+                if a != b:
+                    expected.setdefault(a, Counter())[b] += 1
+    return expected
+
+
+def test_comembership_sync_with_stream_updates():
+    rng = np.random.default_rng(0)
+    engine = CoMembershipEngine()
+
+    def stream(stop):
+        # Same users and groups as the snapshots, so both sides hit the same keys
+        local = np.random.default_rng(1)
+        while not stop.is_set():
+            user, group = int(local.integers(NUM_USERS)), int(local.integers(1, NUM_GROUPS + 1))
+            if local.random() < 0.5:
+                engine.add_membership(user, group)
+            else:
+                engine.remove_membership(user, group)
+
+    def job():
+        for _ in range(ROUNDS):
+            pairs = rng.random((NUM_USERS, NUM_GROUPS)) < 0.1
+            users, groups = np.nonzero(pairs)
+            engine.sync(users, groups + 1, np.full(len(users), np.nan))
+            engine.dense_popularity(NUM_GROUPS)
+            for user in range(0, NUM_USERS, 10):
+                engine.dense_comembership(engine.groups_of(user), NUM_GROUPS)
+
+    run_alongside(job, stream)
+    cooccurrence = {a: Counter({b: n for b, n in row.items() if n}) for a, row in engine.cooccurrence.items()}
+    assert {a: row for a, row in cooccurrence.items() if row} == expected_cooccurrence(engine)
+    assert set(engine.joined_at) == {(u, g) for u, groups in engine.user_groups.items() for g in groups}
+
+
+def test_user_state_reads_while_growing():
+    embeddings = np.random.default_rng(0).normal(size=(NUM_GROUPS, 8)).astype(np.float32)
+    store = UserStateStore(embeddings, seq_len=5, initial_capacity=1)
+    user_embed = np.ones(8, dtype=np.float32)
+    writing = [0]
+
+    def stream(stop):
+        # Every user joins groups 1, 2, 3 in order, so a consistent read sees a prefix
+        for user in range(20_000):
+            if stop.is_set():
+                break
+            writing[0] = user
+            for group in (1, 2, 3):
+                store.record(user, group, "join")
+
+    def job():
+        for _ in range(50_000):
+            # Read the user being written, where a torn read would show
+            user = writing[0]
+            current = store.current(user, user_embed)
+            if current is not None:
+                embed, groups = current
+                assert embed.shape == (8,)
+                assert groups == [1, 2, 3][:len(groups)]
+
+    run_alongside(job, stream)
+
+
+def test_cache_load_does_not_overwrite_newer_write():
+    interner = Interner()
+    fresh = RecommendationBatch.allocate(interner, 2)
+    fresh.append_topk([interner.intern("u1")], "group", np.array([[7, 8]]), np.array([[0.9, 0.8]]), [2])
+    stale = [{"entity_type": "group", "entity_id": "3", "score": 0.5}]
+
+    def loader_racing(write):
+        def loader(user_id):
+            write()  # lands while the Postgres read is in flight
+            return stale
+        return loader
+
+    for write in ("put_batch", "invalidate"):
+        cache = RecommendationCache()
+        cache.loader = loader_racing(
+            (lambda: cache.put_batch(fresh)) if write == "put_batch" else (lambda: cache.invalidate(["u1"])))
+        # The caller still gets the rows it loaded...
+        assert cache.get("u1").ids["group"].tolist() == [3]
+        # ...but they are not cached over the newer write
+        cache.loader = lambda user_id: []
+        expected = [7, 8] if write == "put_batch" else []
+        assert cache.get("u1").ids["group"].tolist() == expected
+
+    # Without a concurrent write, the loaded rows are cached
+    cache = RecommendationCache(loader=lambda user_id: stale)
+    cache.get("u1")
+    cache.loader = None
+    assert cache.get("u1").ids["group"].tolist() == [3]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: ok")
@@ -0,0 +1,154 @@
+# test_supabase_store.py
+# Smoke test for the Supabase data-access layer against a local fake
+# PostgREST server (GET only: eq/gt filters, order, limit, offset).
+# Run directly (python test_supabase_store.py) or with pytest.
+import json
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from interaction_stream import SupabaseInteractionSource
+from supabase_store import SupabaseStore
+
+KEY = "test-key"
+
+
+class FakePostgrest:
+    """In-memory tables served over /rest/v1/<table>; fail_next[table] = n answers n 503s."""
+
+    def __init__(self):
+        self.tables = {}
+        self.fail_next = {}
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                table = url.path[len("/rest/v1/"):]
+                params = urllib.parse.parse_qsl(url.query)
+                fake.requests.append((table, params))
+                if self.headers.get("apikey") != KEY:
+                    return self._send(401, {"message": "bad key"})
+                if fake.fail_next.get(table):
+                    fake.fail_next[table] -= 1
+                    return self._send(503, {"message": "unavailable"})
+                self._send(200, fake.select(table, params))
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def select(self, table, params):
+        rows = list(self.tables.get(table, []))
+        options = {}
+        for column, expr in params:
+            if column in ("select", "order", "limit", "offset"):
+                options[column] = expr
+                continue
+            op, _, value = expr.partition(".")
+            if op == "eq":
+                rows = [r for r in rows if str(r.get(column)) == value]
+            elif op == "gt":
+                rows = [r for r in rows if r.get(column) is not None and r[column] > type(r[column])(value)]
+            else:
+                raise ValueError(f"unsupported filter {expr}")
+        for part in reversed(options.get("order", "").split(",")):
+            if part:
+                column, _, direction = part.partition(".")
+                rows.sort(key=lambda r: r[column], reverse=direction == "desc")
+        offset = int(options.get("offset", 0))
+        limit = int(options["limit"]) if "limit" in options else None
+        rows = rows[offset:offset + limit if limit is not None else None]
+        columns = [c.strip() for c in options.get("select", "*").split(",")]
+        return rows if columns == ["*"] else [{c: r.get(c) for c in columns} for r in rows]
+
+    def close(self):
+        self.server.shutdown()
+
+
+def make_store(fake, **kwargs):
+    return SupabaseStore(fake.url, KEY, backoff_base=0.01, backoff_max=0.05, **kwargs)
+
+
+def test_select_all_paginates():
+    fake = FakePostgrest()
+    fake.tables["users"] = [{"id": i, "name": f"u{i}"} for i in range(25, 0, -1)]
+    store = make_store(fake, page_size=10)
+    rows = store.select_all("users", "id", order="id")
+    assert [r["id"] for r in rows] == list(range(1, 26))
+    assert len(fake.requests) == 3
+    store.close()
+    fake.close()
+
+
+def test_retries_transient_errors():
+    fake = FakePostgrest()
+    fake.tables["groups"] = [{"id": 1}]
+    fake.fail_next["groups"] = 2
+    store = make_store(fake)
+    assert store.select("groups", "id") == [{"id": 1}]
+    assert store.stats()["operations"]["GET groups"]["retries"] == 2
+    store.close()
+    fake.close()
+
+
+def test_interaction_source_tails_new_rows():
+    fake = FakePostgrest()
+    row = {"user_id": "u1", "target_type": "group", "target_id": "3", "action": "view", "created_at": None}
+    fake.tables["interactions"] = [dict(row, id=i) for i in (1, 2)]
+    source = SupabaseInteractionSource(make_store(fake))
+
+    # The first poll only records the current end of the table
+    assert source.poll(10) == [] and source.high_water == 2
+    fake.tables["interactions"] += [dict(row, id=i) for i in (3, 4, 5)]
+    assert [r["id"] for r in source.poll(2)] == [3, 4]
+    assert [r["id"] for r in source.poll(10)] == [5]
+    assert source.poll(10) == [] and source.high_water == 5
+    fake.close()
+
+
+def test_service_stream_reads_from_supabase():
+    fake = FakePostgrest()
+    fake.tables["interactions"] = [{"id": 1, "user_id": "u1", "target_type": "group", "target_id": "3",
+                                    "action": "join", "created_at": None}]
+    os.environ["NEXT_PUBLIC_SUPABASE_URL"] = fake.url
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = KEY
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))  # model path is relative
+    import supabase_store
+    supabase_store._store = None
+    import ml_service
+    ml_service.STREAM_POLL_SECONDS = 60  # only the first poll runs in the background
+
+    stream = ml_service.start_interaction_stream()
+    try:
+        assert stream.source.store is supabase_store.get_store()
+        deadline = time.monotonic() + 10
+        while stream.stats["last_poll"] is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        fake.tables["interactions"].append(dict(fake.tables["interactions"][0], id=2, user_id="u2"))
+        stream.poll_once()
+        assert stream.stats["errors"] == 0 and stream.stats["processed"] == 1
+    finally:
+        stream.stop()
+        fake.close()
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: ok")
@@ -0,0 +1,132 @@
+"""
+Batched top-k selection with exclusions.
+
+Shared by the batch job (recommender.py), event synthesis (ml_service.py)
+and the inference demo (infer.py). Works on a B x G score matrix with a
+sparse per-row exclusion mask in CSR form (indptr, indices), uses partial
+selection (argpartition) instead of a full sort, and writes results into
+caller-provided arrays so a chunked job can reuse its buffers.
+
+Wide rows (SAMPLE_MIN_COLUMNS and up) skip most of the partition: the k-th
+best of every SAMPLE_STRIDE-th column is a lower bound for the row's k-th
+best, so only columns at or above it (about k * SAMPLE_STRIDE per row) are
+partitioned. Rows where that bound does not cut the row down (ties,
+non-finite values) use the full partition.
+"""
+import numpy as np
+
+SAMPLE_STRIDE = 8
+SAMPLE_MIN_COLUMNS = 4096
+
+
+def csr_take_rows(indptr, indices, rows):
+    """Sub-CSR (indptr, indices) for the given row ids of a larger CSR matrix."""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    sub_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=sub_indptr[1:])
+    if sub_indptr[-1] == 0:
+        return sub_indptr, indices[:0]
+    # Gather every [start, start + length) slice in one vectorised index
+    offsets = np.arange(sub_indptr[-1]) - np.repeat(sub_indptr[:-1], lengths)
+    return sub_indptr, indices[np.repeat(starts, lengths) + offsets]
+
+
+def csr_from_lists(lists):
+    """CSR (indptr, indices) from a list of per-row index lists."""
+    lengths = np.fromiter((len(x) for x in lists), dtype=np.int64, count=len(lists))
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.fromiter((i for x in lists for i in x), dtype=np.int64, count=int(indptr[-1]))
+    return indptr, indices
+
+
+def topk_with_exclusions(scores, k, exclude_indptr=None, exclude_indices=None,
+                         out_indices=None, out_scores=None, inplace=False):
+    """Top-k columns per row of `scores`, skipping excluded (row, column) pairs.
+
+    Args:
+        scores: (B, G) float array
+        k: number of results per row
+        exclude_indptr, exclude_indices: CSR exclusion mask with B rows; column
+            indices outside [0, G) are ignored
+        out_indices: optional preallocated (B, k) int64 array
+        out_scores: optional preallocated (B, k) float32 array
+        inplace: mask `scores` in place instead of on a copy
+
+    Returns:
+        (indices, scores, counts): columns and scores best-first (rank = column
+        position + 1), and the number of valid entries per row. Slots past a
+        row's count (all remaining columns excluded) hold -1 / -inf.
+    """
+    scores = np.asarray(scores)
+    if scores.ndim == 1:
+        scores = scores[None, :]
+    B, G = scores.shape
+    k = min(k, G)
+    if out_indices is None:
+        out_indices = np.empty((B, k), dtype=np.int64)
+    if out_scores is None:
+        out_scores = np.empty((B, k), dtype=np.float32)
+    if B == 0 or k == 0:
+        return out_indices[:B, :k], out_scores[:B, :k], np.zeros(B, dtype=np.int64)
+
+    work = scores if inplace else scores.astype(np.float32, copy=True)
+    if exclude_indptr is not None and len(exclude_indices):
+        rows = np.repeat(np.arange(B), np.diff(exclude_indptr))
+        cols = np.asarray(exclude_indices, dtype=np.int64)
+        valid = (cols >= 0) & (cols < G)
+        work[rows[valid], cols[valid]] = -np.inf
+
+    if k < G:
+        # O(G) partial selection per row, then sort only the k survivors
+        part = _partial_topk(work, k)
+    else:
+        part = np.broadcast_to(np.arange(G), (B, G))
+    part_scores = np.take_along_axis(work, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    out_indices[:B, :k] = np.take_along_axis(part, order, axis=1)
+    out_scores[:B, :k] = np.take_along_axis(part_scores, order, axis=1)
+
+    finite = np.isfinite(out_scores[:B, :k])
+    out_indices[:B, :k][~finite] = -1
+    counts = finite.sum(axis=1)
+    return out_indices[:B, :k], out_scores[:B, :k], counts
+
+
+def _partial_topk(work, k):
+    """(B, k) columns holding each row's k largest values, in no particular order (k < G)."""
+    B, G = work.shape
+    if G < SAMPLE_MIN_COLUMNS:
+        return np.argpartition(work, G - k, axis=1)[:, G - k:]
+
+    sample = work[:, ::SAMPLE_STRIDE]
+    S = sample.shape[1]
+    threshold = np.partition(sample, S - k, axis=1)[:, S - k]
+    flat = np.flatnonzero(work >= threshold[:, None])
+    rows = flat // G
+    per_row = np.bincount(rows, minlength=B)
+    # Non-finite bounds (excluded/NaN columns) and heavy ties keep too many or too few columns
+    fallback = ~np.isfinite(threshold) | (per_row > G // 4) | (per_row < k)
+    if fallback.any():
+        keep = ~fallback[rows]
+        flat, rows = flat[keep], rows[keep]
+        per_row[fallback] = 0
+
+    part = np.empty((B, k), dtype=np.int64)
+    if len(flat):
+        width = int(per_row.max())
+        slot = np.arange(len(flat)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+        cand_scores = np.full((B, width), -np.inf, dtype=work.dtype)
+        cand_cols = np.zeros((B, width), dtype=np.int64)
+        cols = flat - rows * G
+        cand_scores[rows, slot] = work[rows, cols]
+        cand_cols[rows, slot] = cols
+        # Every kept row has at least k candidates, all finite and above the -inf padding
+        if width > k:
+            cand_cols = np.take_along_axis(cand_cols, np.argpartition(cand_scores, width - k, axis=1)[:, width - k:], axis=1)
+        part[:] = cand_cols
+    if fallback.any():
+        part[fallback] = np.argpartition(work[fallback], G - k, axis=1)[:, G - k:]
+    return part
@@ -1,7 +1,11 @@
+import argparse
+import random
 import torch
 import numpy as np
 from reco_env import SequentialRecEnv
 from dqn_agent import DQNAgent
+from checkpoint import Checkpointer, load_checkpoint
+from profiling import PROFILE_DIR, ProfileSession
 
 # -----------------------------
 # State preprocessing
@@ -22,21 +26,59 @@ def preprocess_obs(obs, env, device):
 # -----------------------------
 # Training
 # -----------------------------
+parser = argparse.ArgumentParser()
+parser.add_argument("--num-groups", type=int, default=50)
+parser.add_argument("--num-users", type=int, default=200)
+parser.add_argument("--scaled", action="store_true",
+                    help="lazy users, pre-normalized items, allocation-free steps")
+parser.add_argument("--episodes", type=int, default=300)
+parser.add_argument("--seed", type=int, default=None,
+                    help="seed python/numpy/torch and the env (needed for reproducible runs)")
+parser.add_argument("--checkpoint-dir", default="checkpoints")
+parser.add_argument("--checkpoint-every", type=int, default=25,
+                    help="episodes between background checkpoints (0 disables)")
+parser.add_argument("--keep-checkpoints", type=int, default=3)
+parser.add_argument("--resume", nargs="?", const="", default=None, metavar="PATH",
+                    help="resume from a checkpoint dir (default: latest in --checkpoint-dir)")
+parser.add_argument("--profile", nargs="?", const="all", default=None, metavar="PROFILERS",
+                    help="profile the run: comma list of cprofile,torch,tracemalloc (default all)")
+parser.add_argument("--profile-dir", default=PROFILE_DIR)
+parser.add_argument("--profile-torch-steps", type=int, default=50,
+                    help="train steps recorded by torch.profiler (keeps the trace small)")
+args = parser.parse_args()
+
+if args.seed is not None:
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
 env = SequentialRecEnv(
-    num_groups=50,
-    num_users=200,
+    num_groups=args.num_groups,
+    num_users=args.num_users,
     embed_dim=8,
     seq_len=5,
-    max_steps=20
+    max_steps=20,
+    scaled=args.scaled,
+    seed=args.seed,
 )
 
 input_dim = env.embed_dim * 2
 agent = DQNAgent(input_dim=input_dim, action_dim=env.num_groups)
 
-num_episodes = 300
+num_episodes = args.episodes
 reward_history = []
+start_episode = 0
+
+if args.resume is not None:
+    start_episode, reward_history = load_checkpoint(args.resume or args.checkpoint_dir, agent, env)
 
-for episode in range(num_episodes):
+checkpointer = Checkpointer(args.checkpoint_dir, args.checkpoint_every, args.keep_checkpoints)
+profiler = None
+if args.profile:
+    profiler = ProfileSession("train", args.profile, args.profile_dir, torch_steps=args.profile_torch_steps)
+    profiler.start()
+
+for episode in range(start_episode, num_episodes):
     obs, _ = env.reset()
     state = preprocess_obs(obs, env, agent.device)
 
@@ -50,6 +92,8 @@ for episode in range(num_episodes):
 
         agent.buffer.push(state, action, reward, next_state, done)
         agent.train_step()
+        if profiler is not None and len(agent.buffer) >= agent.batch_size:
+            profiler.step()
 
         state = next_state
         total_reward += reward
@@ -59,5 +103,11 @@ for episode in range(num_episodes):
 
     print(f"Episode {episode+1}, Reward: {total_reward:.2f}, Avg(20): {avg_reward:.2f}")
 
+    if checkpointer.due(episode + 1) and episode + 1 < num_episodes:
+        checkpointer.save_async(agent, env, episode + 1, reward_history)
+
+checkpointer.wait()
+if profiler is not None:
+    profiler.stop()
 torch.save(agent.q_net.state_dict(), "dqn_recommender.pth")
 print("Model saved as dqn_recommender.pth")
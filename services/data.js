@@ -1,5 +1,42 @@
 import { createSupabaseServerClient, createSupabaseServiceRoleClient } from "@/supabase/server";
 
+const mlServiceUrl = process.env.ML_SERVICE_URL;
+// A slow or hung ML service must not hold up page renders or writes
+const mlServiceTimeoutMs = Number(process.env.ML_SERVICE_TIMEOUT_MS ?? 1500);
+
+// Read a user's recommendations from the ML service cache; null if unavailable
+async function fetchCachedRecommendations(userId, entityType, limit) {
+  if (!mlServiceUrl) return null;
+  try {
+    const res = await fetch(
+      `${mlServiceUrl}/recommendations/${userId}?type=${entityType}&limit=${limit}`,
+      { cache: "no-store", signal: AbortSignal.timeout(mlServiceTimeoutMs) }
+    );
+    if (!res.ok) return null;
+    const body = await res.json();
+    return body.data.map((r) => ({ ...r, user_id: userId }));
+  } catch {
+    return null;
+  }
+}
+
+// Tell the ML service users' recommendations changed (one id or an array);
+// never blocks the caller on failure
+async function invalidateRecommendations(userIds) {
+  const ids = [...new Set([].concat(userIds))];
+  if (!mlServiceUrl || !ids.length) return;
+  try {
+    await fetch(`${mlServiceUrl}/invalidate`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ user_ids: ids }),
+      signal: AbortSignal.timeout(mlServiceTimeoutMs),
+    });
+  } catch {
+    // Cache entries still expire by TTL if the service is unreachable or slow
+  }
+}
+
 export async function getSessionUser() {
   const supabase = await createSupabaseServerClient();
   const {
@@ -95,6 +132,7 @@ export async function updateUserInterests(interestWeights) {
 
   const { error } = await supabase.from("user_interests").upsert(rows, { onConflict: "user_id,interest_id" });
   if (error) throw error;
+  await invalidateRecommendations(userProfile.id);
   return true;
 }
 
@@ -142,6 +180,7 @@ export async function joinGroup(groupId) {
 
   await supabase.from("group_members").upsert({ group_id: groupId, user_id: profile.id, role: "member" });
   await supabase.from("interactions").insert({ user_id: profile.id, target_type: "group", target_id: String(groupId), action: "join" });
+  await invalidateRecommendations(profile.id);
   return true;
 }
 
@@ -152,6 +191,7 @@ export async function leaveGroup(groupId) {
 
   await supabase.from("group_members").delete().match({ group_id: groupId, user_id: profile.id });
   await supabase.from("interactions").insert({ user_id: profile.id, target_type: "group", target_id: String(groupId), action: "leave" });
+  await invalidateRecommendations(profile.id);
   return true;
 }
 
@@ -207,6 +247,9 @@ export async function getRecommendations(limit = 8) {
   const profile = await ensureUserProfile();
   if (!profile) return [];
 
+  const cached = await fetchCachedRecommendations(profile.id, "group", limit);
+  if (cached) return cached;
+
   const { data, error } = await supabase
     .from("recommendations_metadata")
     .select("*")
@@ -283,5 +326,7 @@ export async function upsertRecommendationScores(records) {
   const serviceClient = createSupabaseServiceRoleClient();
   const { error } = await serviceClient.from("recommendations_metadata").upsert(records, { onConflict: "user_id,entity_type,entity_id" });
   if (error) throw error;
+  // Reads go through the ML cache first; drop stale (or cached empty) entries
+  await invalidateRecommendations(records.map((r) => r.user_id));
   return true;
 }